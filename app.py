@@ -5,8 +5,16 @@ import matplotlib.pyplot as plt
 import altair as alt
 import random
 import os
+import pickle
 import requests
+import sys
 import time
+import re
+import threading
+import bisect
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
 # Page configuration
@@ -284,7 +292,9 @@ def get_ai_response(prompt, history=None):
         }
         
         # Create the system message - ONLY ONE system message with all instructions
-        messages = [{"role": "system", "content": "You are Suhail, an AI assistant specialized in Saudi Arabian real estate. Provide detailed information about properties, neighborhoods, financing options, and transaction processes. Always respond in both Arabic (first) and English (second). Be helpful, detailed, and concise. DO NOT repeat greeting messages if the user has already greeted you. If the user asks the same question multiple times, don't repeat your previous answer verbatim - acknowledge you've answered it before and ask if they need additional details."}]
+        messages = [{"role": "system", "content": "You are Suhail, an AI assistant specialized in Saudi Arabian real estate. Provide detailed information about properties, neighborhoods, financing options, and transaction processes. Always respond in both Arabic (first) and English (second). Be helpful, detailed, and concise. DO NOT repeat greeting messages if the user has already greeted you. If the user asks the same question multiple times, don't repeat your previous answer verbatim - acknowledge you've answered it before and ask if they need additional details."
+                     # Ground price questions in the app's own listings
+                     "\n\nCurrent Suhail listing statistics by area and property type:\n" + price_stats_summary(load_listing_store(), prompt)}]
         
         # Add chat history if available
         if history:
@@ -322,7 +332,7 @@ def get_ai_response(prompt, history=None):
         return "Sorry, there was an error connecting to my knowledge base. Please try again later."
 
 # Sample data - Properties
-@st.cache_data
+# Not cached: the listing store is the only copy kept in memory
 def load_properties():
     properties = [
         {
@@ -460,6 +470,7 @@ def load_banks():
             "max_loan_term": 25,
             "min_down_payment": 10,
             "processing_fee": 1.0,
+            "sharia_compliant": True,
             "special_offers": ["First-time buyer discount", "Government employee discount"],
             "requirements": ["Saudi national or resident", "Minimum 6 months employment", "Salary transfer"]
         },
@@ -471,6 +482,7 @@ def load_banks():
             "max_loan_term": 30,
             "min_down_payment": 15,
             "processing_fee": 0.8,
+            "sharia_compliant": False,
             "special_offers": ["Zero early settlement fees", "Fixed rate options"],
             "requirements": ["Saudi national or resident", "Minimum income SAR 8,000", "Clean credit history"]
         },
@@ -482,6 +494,7 @@ def load_banks():
             "max_loan_term": 25,
             "min_down_payment": 10,
             "processing_fee": 0.75,
+            "sharia_compliant": False,
             "special_offers": ["Family home discount", "Competitive insurance rates"],
             "requirements": ["Saudi national or resident", "Minimum income SAR 7,000", "Age under 60 at end of loan term"]
         },
@@ -493,12 +506,17 @@ def load_banks():
             "max_loan_term": 30,
             "min_down_payment": 10,
             "processing_fee": 0.7,
+            "sharia_compliant": True,
             "special_offers": ["Sharia-compliant options", "Flexible payment schedule"],
             "requirements": ["Saudi national or resident", "Minimum income SAR 6,000", "6+ months with current employer"]
         }
     ]
     return banks
 
+# Helper function to read the numbers out of a fee string such as "1,500 - 3,000 SAR"
+def parse_fee_amounts(text):
+    return [float(amount.replace(",", "")) for amount in re.findall(r"\d[\d,]*(?:\.\d+)?", text)]
+
 # Sample data - Real Estate Consultants
 @st.cache_data
 def load_consultants():
@@ -564,6 +582,12 @@ def load_consultants():
             "certifications": ["REGA Licensed", "First-time Buyer Specialist"]
         }
     ]
+    
+    # Fees are also kept as numbers: a share of the property value or a fixed amount in SAR
+    for consultant in consultants:
+        amount = parse_fee_amounts(consultant["fee"])[0]
+        consultant["fee_percent"] = amount if "%" in consultant["fee"] else None
+        consultant["fee_fixed"] = None if "%" in consultant["fee"] else amount
     return consultants
 
 # Sample data - Building Inspectors
@@ -616,6 +640,11 @@ def load_inspectors():
             "certifications": ["Master Builder", "Certified Home Inspector", "Saudi Engineering Council"]
         }
     ]
+    
+    # Fee ranges are also kept as numeric SAR bounds
+    for inspector in inspectors:
+        amounts = parse_fee_amounts(inspector["fee_range"])
+        inspector["fee_min"], inspector["fee_max"] = amounts[0], amounts[-1]
     return inspectors
 
 # Sample data - Environmental risks
@@ -635,6 +664,7 @@ def load_neighborhoods():
     return [
         {
             "name": "Al Olaya",
+            "name_ar": "العليا",
             "safety": 85,
             "schools": 90,
             "healthcare": 88,
@@ -643,6 +673,7 @@ def load_neighborhoods():
         },
         {
             "name": "Al Nakheel",
+            "name_ar": "النخيل",
             "safety": 92,
             "schools": 85,
             "healthcare": 82,
@@ -651,6 +682,7 @@ def load_neighborhoods():
         },
         {
             "name": "Hittin",
+            "name_ar": "حطين",
             "safety": 90,
             "schools": 82,
             "healthcare": 70,
@@ -659,6 +691,7 @@ def load_neighborhoods():
         },
         {
             "name": "Al Malaz",
+            "name_ar": "الملز",
             "safety": 75,
             "schools": 80,
             "healthcare": 85,
@@ -667,6 +700,7 @@ def load_neighborhoods():
         },
         {
             "name": "Al Naseem",
+            "name_ar": "النسيم",
             "safety": 75,
             "schools": 65,
             "healthcare": 70,
@@ -675,6 +709,1217 @@ def load_neighborhoods():
         }
     ]
 
+# Sample data - Neighborhood amenities
+@st.cache_data
+def load_amenities():
+    return {
+        "Al Olaya": {
+            "Schools": ["International School of Riyadh", "Al Olaya Academy", "British International School"],
+            "Hospitals": ["King Faisal Specialist Hospital", "Saudi German Hospital", "Dr. Sulaiman Al Habib Hospital"],
+            "Shopping": ["Kingdom Centre Mall", "Olaya Malls Complex", "Centria Mall"]
+        },
+        "Al Nakheel": {
+            "Schools": ["American International School", "Al Nakheel Academy", "French International School"],
+            "Hospitals": ["Al Nakheel Medical Center", "Saudi German Hospital", "Dr. Sulaiman Al Habib Hospital"],
+            "Shopping": ["Al Nakheel Mall", "Hayat Mall", "Localizer Mall"]
+        },
+        "Hittin": {
+            "Schools": ["Hittin International School", "Al Hittin Academy", "KAUST School"],
+            "Hospitals": ["Hittin Medical Center", "Healthcare Clinic", "Family Medical Center"],
+            "Shopping": ["Riyadh Front", "Al Hittin Plaza", "U-Walk"]
+        },
+        "Al Malaz": {
+            "Schools": ["Al Malaz Public School", "Eastern Academy", "Technical College"],
+            "Hospitals": ["Al Malaz Hospital", "Security Forces Hospital", "Red Crescent Center"],
+            "Shopping": ["Al Malaz Commercial Center", "Al Makan Mall", "Traditional Souq"]
+        },
+        "Al Naseem": {
+            "Schools": ["Al Naseem Academy", "Modern Education School", "Technical Institute"],
+            "Hospitals": ["Al Naseem Medical Center", "Family Clinic", "Eastern Hospital"],
+            "Shopping": ["Al Naseem Plaza", "Corner Mall", "Eastern Market"]
+        }
+    }
+
+# Metric columns held by the area registry
+RISK_METRICS = ["flood_risk", "air_pollution", "heat_island", "water_quality"]
+QUALITY_METRICS = ["safety", "schools", "healthcare", "shopping", "transportation"]
+
+# Area registry - dense area codes with aligned risk, quality and amenity tables
+@st.cache_resource
+def load_area_registry():
+    risk_data = load_risk_data()
+    neighborhoods = load_neighborhoods()
+    amenities = load_amenities()
+    
+    names = list(dict.fromkeys([r["name"] for r in risk_data] + [n["name"] for n in neighborhoods] + list(amenities)))
+    codes = {name: code for code, name in enumerate(names)}
+    names_ar = {n["name"]: n.get("name_ar", "") for n in neighborhoods}
+    
+    # Row i of each table belongs to area code i; the has_* flags mark areas without data
+    risk = np.zeros((len(names), len(RISK_METRICS)), dtype=np.int16)
+    quality = np.zeros((len(names), len(QUALITY_METRICS)), dtype=np.int16)
+    has_risk = np.zeros(len(names), dtype=bool)
+    has_quality = np.zeros(len(names), dtype=bool)
+    for r in risk_data:
+        risk[codes[r["name"]]] = [r[metric] for metric in RISK_METRICS]
+        has_risk[codes[r["name"]]] = True
+    for n in neighborhoods:
+        quality[codes[n["name"]]] = [n[metric] for metric in QUALITY_METRICS]
+        has_quality[codes[n["name"]]] = True
+    
+    return {
+        "names": names,
+        "names_ar": [names_ar.get(name, "") for name in names],
+        "codes": codes,
+        "risk": risk,
+        "quality": quality,
+        "has_risk": has_risk,
+        "has_quality": has_quality,
+        "amenities": [amenities.get(name, {"Schools": [], "Hospitals": [], "Shopping": []}) for name in names]
+    }
+
+# Function to get an area's risk metrics as a record, or None
+def get_area_risks(area):
+    registry = load_area_registry()
+    code = registry["codes"].get(area)
+    if code is None or not registry["has_risk"][code]:
+        return None
+    return dict({"name": area}, **{metric: int(value) for metric, value in zip(RISK_METRICS, registry["risk"][code])})
+
+# Function to get an area's neighborhood quality metrics as a record, or None
+def get_area_quality(area):
+    registry = load_area_registry()
+    code = registry["codes"].get(area)
+    if code is None or not registry["has_quality"][code]:
+        return None
+    return dict({"name": area}, **{metric: int(value) for metric, value in zip(QUALITY_METRICS, registry["quality"][code])})
+
+# Function to get an area's nearby amenities
+def get_area_amenities(area):
+    registry = load_area_registry()
+    code = registry["codes"].get(area)
+    if code is None:
+        return {"Schools": [], "Hospitals": [], "Shopping": []}
+    return registry["amenities"][code]
+
+# Listing columns that back the per-value facet bitmaps
+FACET_COLUMNS = {"type": "type_code", "area": "area_code", "bedrooms": "bedrooms", "bathrooms": "bathrooms"}
+
+# Function to convert listing records into column arrays
+def listing_columns(store, properties):
+    # Categorical fields are stored as small integer codes into a label list
+    for p in properties:
+        if p["type"] not in store["type_codes"]:
+            store["type_codes"][p["type"]] = len(store["type_labels"])
+            store["type_labels"].append(p["type"])
+        if p["area"] not in store["area_codes"]:
+            store["area_codes"][p["area"]] = len(store["area_labels"])
+            store["area_labels"].append(p["area"])
+    
+    return {
+        # Numeric columns used by search, sorting and analytics
+        "price": np.array([p["price"] for p in properties], dtype=np.int64),
+        "size_sqm": np.array([p["size_sqm"] for p in properties], dtype=np.int32),
+        "bedrooms": np.array([p["bedrooms"] for p in properties], dtype=np.int8),
+        "bathrooms": np.array([p["bathrooms"] for p in properties], dtype=np.int8),
+        "type_code": np.array([store["type_codes"][p["type"]] for p in properties], dtype=np.int16),
+        "area_code": np.array([store["area_codes"][p["area"]] for p in properties], dtype=np.int16),
+        "verified": np.array([p.get("verified", False) for p in properties], dtype=bool),
+        "roi": np.array([float(p.get("roi_estimate", "5.0%").strip("%")) for p in properties], dtype=np.float64),
+        "lat": np.array([p["location"]["lat"] for p in properties], dtype=np.float64),
+        "lng": np.array([p["location"]["lng"] for p in properties], dtype=np.float64),
+        "rating": np.array([p.get("rating", 4.0) for p in properties], dtype=np.float64),
+        "date_added": np.array([p.get("date_added", "2025-01-01") for p in properties], dtype="datetime64[D]"),
+        # Bumped on every edit so cached renderings of the listing can be told apart
+        "version": np.zeros(len(properties), dtype=np.int32),
+        # Fair-price check against the listing's (area, type) group, kept current by the price statistics
+        "price_z": np.zeros(len(properties), dtype=np.float32),
+        "price_flag": np.zeros(len(properties), dtype=np.int8),
+        # Text columns are only read when a card or detail view is rendered
+        "id": [p["id"] for p in properties],
+        "title": [p["title"] for p in properties],
+        "title_ar": [p["title_ar"] for p in properties],
+        "description": [p["description"] for p in properties],
+        "description_ar": [p["description_ar"] for p in properties],
+        "features": [p["features"] for p in properties],
+        "features_ar": [p["features_ar"] for p in properties],
+    }
+
+# Function to build the columnar listing store
+def build_listing_store(properties, area_labels=None):
+    store = {
+        "size": 0,
+        "type_labels": [],
+        "area_labels": list(area_labels or []),
+        "type_codes": {},
+        "area_codes": {label: code for code, label in enumerate(area_labels or [])},
+        # Packed little-endian bitmaps per facet value, one bit per listing row
+        "bitmaps": {facet: {} for facet in FACET_COLUMNS},
+        # Presorted row permutations, one per "Sort By" option
+        "sort_orders": {sort_option: np.zeros(0, dtype=np.int64) for sort_option in SORT_KEYS},
+        # Listing id -> row position, for O(1) lookups from the details page
+        "row_by_id": {},
+        # Inverted index over both languages: term -> (rows, weighted term frequencies)
+        "text_postings": {},
+        "doc_length": np.zeros(0, dtype=np.float32),
+        # Grid cell key per row, and the rows ordered by cell for bounding-box scans
+        "geo_cell": np.zeros(0, dtype=np.int64),
+        "geo_order": np.zeros(0, dtype=np.int64),
+        "geo_sorted_cells": np.zeros(0, dtype=np.int64),
+        # Map marker clusters per zoom tier: rows ordered by cluster cell, plus per-cell aggregates
+        "clusters": {zoom: {
+            "order": np.zeros(0, dtype=np.int64),
+            "sorted_cells": np.zeros(0, dtype=np.int64),
+            "cluster_cells": np.zeros(0, dtype=np.int64),
+            "count": np.zeros(0, dtype=np.int64),
+            "lat": np.zeros(0, dtype=np.float64),
+            "lng": np.zeros(0, dtype=np.float64),
+            "median_price": np.zeros(0, dtype=np.float64)
+        } for zoom in CLUSTER_ZOOM_TIERS},
+        # Rows ordered by (area, type) group, and the price statistics of every group
+        "stats_order": np.zeros(0, dtype=np.int64),
+        "stats_sorted_keys": np.zeros(0, dtype=np.int64),
+        "price_stats": {},
+        "lock": threading.Lock()
+    }
+    store.update(listing_columns(store, []))
+    add_listings(store, properties)
+    return store
+
+# Helper function to get (or grow) the bitmap for one facet value
+def facet_bitmap(store, facet, value):
+    n_bytes = (store["size"] + 7) // 8
+    bitmap = store["bitmaps"][facet].get(value)
+    if bitmap is None:
+        bitmap = np.zeros(n_bytes, dtype=np.uint8)
+    elif len(bitmap) < n_bytes:
+        bitmap = np.concatenate([bitmap, np.zeros(n_bytes - len(bitmap), dtype=np.uint8)])
+    store["bitmaps"][facet][value] = bitmap
+    return bitmap
+
+# Helper function to set or clear listing rows in a facet bitmap
+def set_bitmap_rows(bitmap, rows, on=True):
+    rows = np.asarray(rows, dtype=np.int64)
+    bits = (np.uint8(1) << (rows & 7).astype(np.uint8)).astype(np.uint8)
+    if on:
+        np.bitwise_or.at(bitmap, rows >> 3, bits)
+    else:
+        np.bitwise_and.at(bitmap, rows >> 3, ~bits)
+
+# Function to append new listings to the store and its facet bitmaps
+def add_listings(store, properties):
+    with store["lock"]:
+        start = store["size"]
+        columns = listing_columns(store, properties)
+        
+        # Swap in extended columns so readers never see a half-written array
+        for name, values in columns.items():
+            if isinstance(values, list):
+                store[name] = store[name] + values
+            else:
+                store[name] = np.concatenate([store[name], values])
+        store["size"] = start + len(properties)
+        for offset, listing_id in enumerate(columns["id"]):
+            store["row_by_id"][listing_id] = start + offset
+        store["doc_length"] = np.concatenate([store["doc_length"], np.zeros(len(properties), dtype=np.float32)])
+        
+        # Only the appended rows are written into the bitmaps
+        rows = np.arange(start, store["size"])
+        for facet, column in FACET_COLUMNS.items():
+            for value in store["bitmaps"][facet]:
+                facet_bitmap(store, facet, value)
+            values = store[column][rows]
+            for value in np.unique(values):
+                set_bitmap_rows(facet_bitmap(store, facet, int(value)), rows[values == value])
+        
+        index_listing_text(store, rows)
+        
+        # New rows are merged into the presorted orders instead of re-sorting everything
+        for sort_option, order in store["sort_orders"].items():
+            store["sort_orders"][sort_option] = merge_sort_order(sort_key_values(store, sort_option), order, rows)
+        
+        # The spatial grid is kept the same way, ordered by cell key
+        store["geo_cell"] = np.concatenate([store["geo_cell"], geo_cell_keys(columns["lat"], columns["lng"])])
+        store["geo_order"] = merge_sort_order(store["geo_cell"], store["geo_order"], rows)
+        store["geo_sorted_cells"] = store["geo_cell"][store["geo_order"]]
+        
+        # Cluster aggregates are recomputed only for the cells that received new rows
+        for zoom, tier in store["clusters"].items():
+            keys = cluster_cell_keys(zoom, store["lat"], store["lng"])
+            order = merge_sort_order(keys, tier["order"], rows)
+            store["clusters"][zoom] = refresh_clusters(store, dict(tier, order=order, sorted_cells=keys[order]), keys[rows])
+        
+        # Price statistics are recomputed only for the groups that received new rows
+        keys = price_stats_keys(store)
+        store["stats_order"] = merge_sort_order(keys, store["stats_order"], rows)
+        store["stats_sorted_keys"] = keys[store["stats_order"]]
+        refresh_price_stats(store, keys[rows])
+    
+    return rows
+
+# Function to apply field changes to one listing row, keeping the bitmaps in sync
+def update_listing(store, row, changes):
+    with store["lock"]:
+        changes = dict(changes)
+        old_location = None
+        old_stats_key = price_stats_keys(store, row)
+        if "location" in changes:
+            location = changes.pop("location")
+            old_location = (store["lat"][row], store["lng"][row])
+            store["lat"][row] = location["lat"]
+            store["lng"][row] = location["lng"]
+            cell = geo_cell_keys(store["lat"][row], store["lng"][row])
+            if cell != store["geo_cell"][row]:
+                store["geo_cell"][row] = cell
+                store["geo_order"] = reposition_sort_row(store["geo_cell"], store["geo_order"], row)
+                store["geo_sorted_cells"] = store["geo_cell"][store["geo_order"]]
+        if "roi_estimate" in changes:
+            changes["roi"] = float(changes.pop("roi_estimate").strip("%"))
+        if "type" in changes or "area" in changes:
+            current = get_listing_view(store, row)
+            current.update({k: changes.pop(k) for k in ("type", "area") if k in changes})
+            codes = listing_columns(store, [current])
+            changes["type_code"] = codes["type_code"][0]
+            changes["area_code"] = codes["area_code"][0]
+        # Changed text is re-indexed: old postings out now, new ones in after the write
+        text_changed = any(name in changes for name in TEXT_FIELD_WEIGHTS)
+        if text_changed:
+            remove_listing_text(store, row)
+        
+        for name, value in changes.items():
+            if name in FACET_COLUMNS.values():
+                facet = next(f for f, c in FACET_COLUMNS.items() if c == name)
+                set_bitmap_rows(facet_bitmap(store, facet, int(store[name][row])), [row], on=False)
+                set_bitmap_rows(facet_bitmap(store, facet, int(value)), [row])
+            store[name][row] = value
+        if text_changed:
+            index_listing_text(store, [row])
+        store["version"][row] += 1
+        
+        # A changed sort key moves the row to its new position in that order
+        for sort_option, (column, _) in SORT_KEYS.items():
+            if column in changes:
+                store["sort_orders"][sort_option] = reposition_sort_row(sort_key_values(store, sort_option), store["sort_orders"][sort_option], row)
+        
+        # A moved or repriced listing refreshes the clusters it leaves and joins
+        if old_location is not None or "price" in changes:
+            for zoom, tier in store["clusters"].items():
+                keys = cluster_cell_keys(zoom, store["lat"], store["lng"])
+                old_cell = cluster_cell_keys(zoom, *old_location) if old_location is not None else keys[row]
+                order = reposition_sort_row(keys, tier["order"], row) if old_cell != keys[row] else tier["order"]
+                store["clusters"][zoom] = refresh_clusters(store, dict(tier, order=order, sorted_cells=keys[order]), [old_cell, keys[row]])
+        
+        # Changes to priced fields refresh the statistics of the old and new (area, type) groups
+        if any(name in changes for name in ("price", "size_sqm", "roi", "area_code", "type_code")):
+            keys = price_stats_keys(store)
+            if keys[row] != old_stats_key:
+                store["stats_order"] = reposition_sort_row(keys, store["stats_order"], row)
+                store["stats_sorted_keys"] = keys[store["stats_order"]]
+            refresh_price_stats(store, [old_stats_key, keys[row]])
+
+# Columnar listing store - built once per process and shared by all sessions
+@st.cache_resource
+def load_listing_store():
+    # Area codes follow the area registry, so registry tables can be indexed by a listing's area code
+    return build_listing_store(load_properties(), load_area_registry()["names"])
+
+# Function to materialize a single listing row as a property dict
+def get_listing_view(store, row):
+    return {
+        "id": store["id"][row],
+        "title": store["title"][row],
+        "title_ar": store["title_ar"][row],
+        "price": int(store["price"][row]),
+        "size_sqm": int(store["size_sqm"][row]),
+        "bedrooms": int(store["bedrooms"][row]),
+        "bathrooms": int(store["bathrooms"][row]),
+        "type": store["type_labels"][store["type_code"][row]],
+        "area": store["area_labels"][store["area_code"][row]],
+        "description": store["description"][row],
+        "description_ar": store["description_ar"][row],
+        "features": store["features"][row],
+        "features_ar": store["features_ar"][row],
+        "location": {"lat": float(store["lat"][row]), "lng": float(store["lng"][row])},
+        "rating": float(store["rating"][row]),
+        "verified": bool(store["verified"][row]),
+        "date_added": str(store["date_added"][row]),
+        "roi_estimate": f"{store['roi'][row]:.1f}%",
+        "version": int(store["version"][row])
+    }
+
+# Function to look up a listing by id, returning its property dict or None
+def get_listing(store, listing_id):
+    row = store["row_by_id"].get(listing_id)
+    if row is None:
+        return None
+    return get_listing_view(store, row)
+
+# Id lookup tables for consultants and inspectors, shared by all sessions
+@st.cache_resource
+def load_consultant_index():
+    return {c["id"]: c for c in load_consultants()}
+
+@st.cache_resource
+def load_inspector_index():
+    return {i["id"]: i for i in load_inspectors()}
+
+# Function to compile search widget state into a listing query
+def build_search_query(min_price=0, max_price=10000000, bedrooms=None, bathrooms=None, property_type=None,
+                       area=None, min_size=0, max_size=1000, verified_only=False, keywords="", underpriced_only=False):
+    # Range bounds left at the widget limits are dropped so they cost nothing
+    return {
+        "min_price": min_price if min_price > 0 else None,
+        "max_price": max_price if max_price < 10000000 else None,
+        "bedrooms": list(bedrooms or []),
+        "bathrooms": list(bathrooms or []),
+        "property_type": list(property_type or []),
+        "area": list(area or []),
+        "min_size": min_size if min_size > 0 else None,
+        "max_size": max_size if max_size < 1000 else None,
+        "verified_only": verified_only,
+        "keywords": tokenize_text(keywords),
+        "underpriced_only": underpriced_only
+    }
+
+# Search query keys answered by facet bitmaps
+QUERY_FACETS = {"property_type": "type", "area": "area", "bedrooms": "bedrooms", "bathrooms": "bathrooms"}
+
+# Helper function to map facet option labels to bitmap keys
+def facet_codes(store, facet, values):
+    if facet == "type":
+        return [store["type_codes"][v] for v in values if v in store["type_codes"]]
+    if facet == "area":
+        return [store["area_codes"][v] for v in values if v in store["area_codes"]]
+    return [int(v) for v in values]
+
+# Function to OR together the bitmaps of the selected options of one facet
+def facet_union(store, facet, values):
+    union = np.zeros((store["size"] + 7) // 8, dtype=np.uint8)
+    for code in facet_codes(store, facet, values):
+        bitmap = store["bitmaps"][facet].get(code)
+        if bitmap is not None:
+            union |= bitmap[:len(union)]
+    return union
+
+# Helper function to expand a packed bitmap into a boolean row mask
+def unpack_bitmap(bitmap, size):
+    return np.unpackbits(bitmap, count=size, bitorder="little").view(bool)
+
+# Function to evaluate the range and flag clauses of a query as a boolean mask
+def range_mask(store, query):
+    mask = np.ones(store["size"], dtype=bool)
+    
+    if query["min_price"] is not None:
+        mask &= store["price"] >= query["min_price"]
+    if query["max_price"] is not None:
+        mask &= store["price"] <= query["max_price"]
+    if query["min_size"] is not None:
+        mask &= store["size_sqm"] >= query["min_size"]
+    if query["max_size"] is not None:
+        mask &= store["size_sqm"] <= query["max_size"]
+    if query["verified_only"]:
+        mask &= store["verified"]
+    if query["keywords"]:
+        mask &= keyword_mask(store, query["keywords"])
+    if query["underpriced_only"]:
+        mask &= store["price_flag"] < 0
+    
+    return mask
+
+# Function to evaluate a listing query: AND of facet unions, then the range clauses
+def filter_mask(store, query):
+    bits = None
+    for key, facet in QUERY_FACETS.items():
+        if query[key]:
+            union = facet_union(store, facet, query[key])
+            bits = union if bits is None else bits & union
+    
+    mask = range_mask(store, query)
+    if bits is not None:
+        mask &= unpack_bitmap(bits, store["size"])
+    return mask
+
+# Lookup table of set bits per byte, used to count packed bitmaps
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Function to count matching listings per option of every facet in one pass
+def facet_counts(store, query):
+    # Each facet is counted against the other filters only, so its own selection still shows alternatives
+    base = np.packbits(range_mask(store, query), bitorder="little")
+    unions = {key: facet_union(store, facet, query[key]) for key, facet in QUERY_FACETS.items() if query[key]}
+    
+    counts = {}
+    for key, facet in QUERY_FACETS.items():
+        bits = base
+        for other, union in unions.items():
+            if other != key:
+                bits = bits & union
+        
+        labels = {"type": store["type_labels"], "area": store["area_labels"]}.get(facet)
+        counts[key] = {
+            labels[code] if labels else code: int(POPCOUNT_TABLE[bits & bitmap].sum())
+            for code, bitmap in store["bitmaps"][facet].items()
+        }
+    
+    return counts
+
+# Function to return the listing rows matching a query
+def filter_listings(store, query):
+    return np.flatnonzero(filter_mask(store, query))
+
+# "Sort By" options mapped to the listing column and direction they order by
+SORT_KEYS = {
+    "Price (Low to High)": ("price", 1),
+    "Price (High to Low)": ("price", -1),
+    "Newest First": ("date_added", -1),
+    "Highest Rated": ("rating", -1),
+    "Highest ROI": ("roi", -1)
+}
+
+# Helper function to get ascending sort keys for a "Sort By" option
+def sort_key_values(store, sort_option):
+    column, direction = SORT_KEYS[sort_option]
+    values = store[column]
+    if column == "date_added":
+        values = values.astype(np.int64)
+    return values * direction
+
+# Function to merge new rows into a presorted permutation of the listings
+def merge_sort_order(keys, order, new_rows):
+    # Ties keep row order: new rows are last in the store, so they go after equal keys
+    new_rows = new_rows[np.argsort(keys[new_rows], kind="stable")]
+    positions = np.searchsorted(keys[order], keys[new_rows], side="right")
+    return np.insert(order, positions, new_rows)
+
+# Function to move one row whose sort key changed to its new place in a presorted permutation
+def reposition_sort_row(keys, order, row):
+    order = order[order != row]
+    sorted_keys = keys[order]
+    low = np.searchsorted(sorted_keys, keys[row], side="left")
+    high = np.searchsorted(sorted_keys, keys[row], side="right")
+    # Among equal keys rows stay in row order
+    position = low + np.searchsorted(order[low:high], row)
+    return np.insert(order, position, row)
+
+# Number of property cards rendered per search results page
+RESULTS_PAGE_SIZE = 10
+
+# Function to return one page of matching rows in sorted order from a presorted permutation
+def top_listings(store, mask, sort_option, k, offset=0, block_size=8192):
+    order = store["sort_orders"].get(sort_option)
+    if order is None:
+        return np.flatnonzero(mask)[offset:offset + k]
+    
+    # Walk the permutation in blocks and stop once the requested page is filled
+    needed = offset + k
+    found = []
+    count = 0
+    for start in range(0, len(order), block_size):
+        block = order[start:start + block_size]
+        hits = block[mask[block]]
+        found.append(hits)
+        count += len(hits)
+        if count >= needed:
+            break
+    
+    rows = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+    return rows[offset:needed]
+
+# Listing text fields in the keyword index, with the weight each occurrence counts for
+TEXT_FIELD_WEIGHTS = {"title": 2, "title_ar": 2, "description": 1, "description_ar": 1, "features": 1, "features_ar": 1}
+# Arabic harakat, superscript alef and tatweel are dropped before indexing
+ARABIC_DIACRITICS = re.compile("[\u064B-\u0652\u0670\u0640]")
+WORD_PATTERN = re.compile(r"\w+")
+# Alef, yaa and taa marbuta variants fold to one letter, so spelling variants match
+ARABIC_FOLDING = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه"})
+
+# Function to normalize English and Arabic text for indexing and querying
+def normalize_text(text):
+    return ARABIC_DIACRITICS.sub("", text.lower()).translate(ARABIC_FOLDING)
+
+# Function to split text into normalized search terms
+def tokenize_text(text):
+    # The Arabic definite article is dropped so "المسبح" and "مسبح" match
+    return [term[2:] if term.startswith("ال") and len(term) > 3 else term for term in WORD_PATTERN.findall(normalize_text(text or ""))]
+
+# Helper function to count a listing row's weighted terms across its text fields
+def listing_terms(store, row):
+    counts = {}
+    for field, weight in TEXT_FIELD_WEIGHTS.items():
+        value = store[field][row]
+        for term in tokenize_text(" ".join(value) if isinstance(value, list) else value):
+            counts[term] = counts.get(term, 0) + weight
+    return counts
+
+# Function to add listing rows to the keyword index
+def index_listing_text(store, rows):
+    # Collect the new postings per term first so each posting list grows once
+    new_postings = {}
+    for row in rows:
+        terms = listing_terms(store, row)
+        store["doc_length"][row] = sum(terms.values())
+        for term, frequency in terms.items():
+            term_rows, frequencies = new_postings.setdefault(term, ([], []))
+            term_rows.append(row)
+            frequencies.append(frequency)
+    
+    for term, (term_rows, frequencies) in new_postings.items():
+        term_rows = np.array(term_rows, dtype=np.int64)
+        frequencies = np.array(frequencies, dtype=np.float32)
+        if term in store["text_postings"]:
+            old_rows, old_frequencies = store["text_postings"][term]
+            term_rows = np.concatenate([old_rows, term_rows])
+            frequencies = np.concatenate([old_frequencies, frequencies])
+        store["text_postings"][term] = (term_rows, frequencies)
+
+# Function to remove a listing row from the keyword index
+def remove_listing_text(store, row):
+    for term in listing_terms(store, row):
+        term_rows, frequencies = store["text_postings"][term]
+        keep = term_rows != row
+        if keep.any():
+            store["text_postings"][term] = (term_rows[keep], frequencies[keep])
+        else:
+            del store["text_postings"][term]
+    store["doc_length"][row] = 0
+
+# Function to mark listing rows containing any of the query terms
+def keyword_mask(store, terms):
+    mask = np.zeros(store["size"], dtype=bool)
+    for term in terms:
+        posting = store["text_postings"].get(term)
+        if posting is not None:
+            mask[posting[0]] = True
+    return mask
+
+# Function to score every listing row against the query terms with BM25
+def bm25_scores(store, terms, k1=1.2, b=0.75):
+    scores = np.zeros(store["size"], dtype=np.float32)
+    documents = np.count_nonzero(store["doc_length"])
+    if documents == 0:
+        return scores
+    average_length = store["doc_length"].sum() / documents
+    
+    for term in set(terms):
+        posting = store["text_postings"].get(term)
+        if posting is None:
+            continue
+        term_rows, frequencies = posting
+        idf = np.log(1 + (documents - len(term_rows) + 0.5) / (len(term_rows) + 0.5))
+        length_norm = k1 * (1 - b + b * store["doc_length"][term_rows] / average_length)
+        scores[term_rows] += idf * frequencies * (k1 + 1) / (frequencies + length_norm)
+    
+    return scores
+
+# Function to return one page of matching rows ranked by keyword relevance
+def rank_listings_text(store, terms, mask, k, offset=0):
+    scores = bm25_scores(store, terms)
+    rows = np.flatnonzero(mask & (scores > 0))
+    needed = offset + k
+    
+    return top_scored_rows(rows, scores[rows], needed)[offset:]
+
+# Function to pick the k highest-scoring rows, best first (ties in row order)
+def top_scored_rows(rows, scores, k):
+    # Only the top of the ranking (with any ties at the cut) is fully sorted
+    if len(rows) > k:
+        cutoff = -np.partition(-scores, k - 1)[k - 1]
+        keep = scores >= cutoff
+        rows, scores = rows[keep], scores[keep]
+    return rows[np.lexsort((rows, -scores))][:k]
+
+# Helper function to allow more typos in longer autocomplete input
+def suggestion_max_distance(length):
+    if length < 4:
+        return 0
+    return 1 if length < 8 else 2
+
+# Typo deletes are indexed for key prefixes up to this length; longer input is matched on
+# its first characters and then checked against the rest of the key
+SUGGESTION_TYPO_PREFIX = 8
+
+# Helper function to generate every string reachable by deleting up to `distance` characters
+def symmetric_deletes(term, distance):
+    deletes = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        deletes |= frontier
+    return deletes
+
+# Helper function to compute the edit distance (with adjacent swaps) between two short strings
+# With all_prefixes, returns the distance from b to every prefix of a (index = prefix length)
+def edit_distance(a, b, all_prefixes=False):
+    previous_row, row = None, list(range(len(b) + 1))
+    prefix_distances = [row[-1]]
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        prefix_distances.append(row[-1])
+    return prefix_distances if all_prefixes else row[-1]
+
+# Function to build the autocomplete index for a list of suggestion entries
+def build_suggestion_index(entries):
+    keys = []
+    deletes = {}
+    for entry_index, entry in enumerate(entries):
+        for alias in entry["aliases"]:
+            words = tokenize_text(alias)
+            # Every word start is a key, so "pool" finds "Private Pool"
+            for start in range(len(words)):
+                key = " ".join(words[start:])
+                keys.append((key, entry_index, alias))
+                # Deletes of the short key prefixes let misspelled partial input meet it halfway
+                for length in range(1, min(len(key), SUGGESTION_TYPO_PREFIX) + 1):
+                    prefix = key[:length]
+                    for delete in symmetric_deletes(prefix, suggestion_max_distance(length)):
+                        deletes.setdefault(delete, set()).add((key, length, entry_index, alias))
+    
+    keys.sort()
+    return {"entries": entries, "keys": keys, "key_strings": [key for key, _, _ in keys], "deletes": deletes}
+
+# Function to suggest entries for partially typed, possibly misspelled input
+def suggest_terms(index, text, limit=5):
+    query = " ".join(tokenize_text(text))
+    if not query:
+        return []
+    
+    # Exact prefix matches are one contiguous run of the sorted keys
+    best = {}
+    low = bisect.bisect_left(index["key_strings"], query)
+    high = bisect.bisect_left(index["key_strings"], query + "\uffff")
+    for _, entry_index, alias in index["keys"][low:high]:
+        best.setdefault(entry_index, (0, alias))
+    
+    # Typos: any key prefix within the allowed distance shares a delete with the query's start
+    max_distance = suggestion_max_distance(len(query))
+    head = query[:SUGGESTION_TYPO_PREFIX]
+    distances = {}
+    for delete in symmetric_deletes(head, max_distance):
+        for key, length, entry_index, alias in index["deletes"].get(delete, ()):
+            if entry_index in best and best[entry_index][0] == 0:
+                continue
+            # Short input is compared with the matched prefix; longer input with the key prefixes of about its length
+            candidate = key[:length] if len(query) <= SUGGESTION_TYPO_PREFIX else key[:len(query) + max_distance]
+            if candidate not in distances:
+                if len(query) <= SUGGESTION_TYPO_PREFIX:
+                    distances[candidate] = edit_distance(query, candidate)
+                else:
+                    distances[candidate] = min(edit_distance(candidate, query, all_prefixes=True)[len(query) - max_distance:], default=max_distance + 1)
+            distance = distances[candidate]
+            if distance <= max_distance and distance < best.get(entry_index, (max_distance + 1,))[0]:
+                best[entry_index] = (distance, alias)
+    
+    ranked = sorted(best.items(), key=lambda item: (item[1][0], -index["entries"][item[0]]["count"], index["entries"][item[0]]["label"]))
+    return [dict(index["entries"][entry_index], alias=alias, distance=distance) for entry_index, (distance, alias) in ranked[:limit]]
+
+# Autocomplete index over area and feature names; rebuilt after listings were added or edited
+# (the stamp is the store's row count and edit count, as for the comparables index)
+@st.cache_resource(max_entries=1)
+def load_suggestion_index(stamp):
+    store = load_listing_store()
+    listing_count = stamp[0]
+    registry = load_area_registry()
+    names_ar = dict(zip(registry["names"], registry["names_ar"]))
+    
+    entries = []
+    for code, name in enumerate(store["area_labels"]):
+        entries.append({
+            "kind": "area",
+            "value": name,
+            "label": f"{name} / {names_ar[name]}" if names_ar.get(name) else name,
+            "aliases": [name, names_ar.get(name, "")],
+            "count": int(np.count_nonzero(store["area_code"][:listing_count] == code))
+        })
+    
+    # Features are paired with their Arabic names by position in each listing
+    feature_counts = {}
+    for row in range(listing_count):
+        for pair in zip(store["features"][row], store["features_ar"][row]):
+            feature_counts[pair] = feature_counts.get(pair, 0) + 1
+    for (feature, feature_ar), count in feature_counts.items():
+        entries.append({
+            "kind": "feature",
+            "value": feature,
+            "label": f"{feature} / {feature_ar}",
+            "aliases": [feature, feature_ar],
+            "count": count
+        })
+    
+    return build_suggestion_index(entries)
+
+# Group keys are area_code * PRICE_STATS_TYPE_SLOTS + type_code, so each area's groups are contiguous
+PRICE_STATS_TYPE_SLOTS = 1024
+PRICE_STATS_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+# Listings this many robust standard deviations from their group's price per sqm are flagged
+FAIR_PRICE_Z_THRESHOLD = 2.0
+# Groups smaller than this are too thin to call a listing under- or overpriced
+FAIR_PRICE_MIN_GROUP = 5
+# price_flag value for listings whose group is too small (or too uniform) to judge
+FAIR_PRICE_NOT_ASSESSED = 2
+# Most statistics lines sent to the chat assistant, so the system prompt stays small at any catalog size
+PRICE_STATS_SUMMARY_MAX_LINES = 20
+
+# Helper function to compute (area, type) group keys for listing rows
+def price_stats_keys(store, rows=slice(None)):
+    return store["area_code"][rows].astype(np.int64) * PRICE_STATS_TYPE_SLOTS + store["type_code"][rows]
+
+# Function to summarize price per sqm and ROI over a set of listing rows
+def group_price_stats(store, rows):
+    price_per_sqm = store["price"][rows] / np.maximum(store["size_sqm"][rows], 1)
+    roi = store["roi"][rows]
+    price_quantiles = np.quantile(price_per_sqm, PRICE_STATS_QUANTILES)
+    roi_quantiles = np.quantile(roi, PRICE_STATS_QUANTILES)
+    return {
+        "count": len(rows),
+        "mean_price_per_sqm": float(price_per_sqm.mean()),
+        "median_price_per_sqm": float(price_quantiles[2]),
+        "mad_price_per_sqm": float(np.median(np.abs(price_per_sqm - price_quantiles[2]))),
+        "price_per_sqm_quantiles": dict(zip(PRICE_STATS_QUANTILES, price_quantiles.tolist())),
+        "mean_roi": float(roi.mean()),
+        "median_roi": float(roi_quantiles[2]),
+        "roi_quantiles": dict(zip(PRICE_STATS_QUANTILES, roi_quantiles.tolist()))
+    }
+
+# Function to recompute the price statistics of some (area, type) groups and of their areas
+def refresh_price_stats(store, group_keys):
+    group_keys = np.unique(group_keys)
+    area_codes = np.unique(group_keys // PRICE_STATS_TYPE_SLOTS)
+    
+    # Each group, and each whole area (type -1), is one contiguous run of the group-ordered rows
+    runs = [(int(key // PRICE_STATS_TYPE_SLOTS), int(key % PRICE_STATS_TYPE_SLOTS), key, key + 1) for key in group_keys]
+    runs += [(int(code), -1, code * PRICE_STATS_TYPE_SLOTS, (code + 1) * PRICE_STATS_TYPE_SLOTS) for code in area_codes]
+    for area_code, type_code, low, high in runs:
+        start, end = np.searchsorted(store["stats_sorted_keys"], [low, high], side="left")
+        if end > start:
+            rows = store["stats_order"][start:end]
+            stats = group_price_stats(store, rows)
+            store["price_stats"][(area_code, type_code)] = stats
+            if type_code != -1:
+                flag_price_outliers(store, rows, stats)
+        else:
+            store["price_stats"].pop((area_code, type_code), None)
+
+# Function to score a group's listings by robust z-score of price per sqm and flag outliers
+# (-1 under, 1 over, 0 in line, FAIR_PRICE_NOT_ASSESSED with a NaN score when the group cannot be judged)
+def flag_price_outliers(store, rows, stats):
+    # 1.4826 * MAD estimates the standard deviation without being pulled by the outliers themselves
+    spread = 1.4826 * stats["mad_price_per_sqm"]
+    if stats["count"] < FAIR_PRICE_MIN_GROUP or spread == 0:
+        store["price_z"][rows] = np.nan
+        store["price_flag"][rows] = FAIR_PRICE_NOT_ASSESSED
+        return
+    z = (store["price"][rows] / np.maximum(store["size_sqm"][rows], 1) - stats["median_price_per_sqm"]) / spread
+    store["price_z"][rows] = z
+    store["price_flag"][rows] = np.where(z <= -FAIR_PRICE_Z_THRESHOLD, -1, np.where(z >= FAIR_PRICE_Z_THRESHOLD, 1, 0))
+
+# Function to look up the price statistics of an area, optionally for one property type
+def get_price_stats(store, area, property_type=None):
+    area_code = store["area_codes"].get(area)
+    type_code = -1 if property_type is None else store["type_codes"].get(property_type)
+    if area_code is None or type_code is None:
+        return None
+    return store["price_stats"].get((area_code, type_code))
+
+# Function to describe the listing market in plain text for the chat assistant
+# Areas named in the prompt get a line per property type; the rest get one area-wide line, largest first
+def price_stats_summary(store, prompt="", max_lines=PRICE_STATS_SUMMARY_MAX_LINES):
+    registry = load_area_registry()
+    # Whole-word matching, so "District 7" does not pick up "District 70"
+    prompt = f" {' '.join(tokenize_text(prompt))} "
+    named_areas = set()
+    for area_code, label in enumerate(store["area_labels"]):
+        names = [label] + ([registry["names_ar"][area_code]] if area_code < len(registry["names_ar"]) else [])
+        if any(name and f" {' '.join(tokenize_text(name))} " in prompt for name in names):
+            named_areas.add(area_code)
+    
+    groups = [(key, stats) for key, stats in store["price_stats"].items() if key[1] == -1 or key[0] in named_areas]
+    groups.sort(key=lambda group: (group[0][0] not in named_areas, -group[1]["count"], group[0]))
+    
+    lines = []
+    for (area_code, type_code), stats in groups[:max_lines]:
+        group = store["area_labels"][area_code] + (" (all types)" if type_code == -1 else f" {store['type_labels'][type_code]}s")
+        lines.append(f"{group}: {stats['count']} listings, average {stats['mean_price_per_sqm']:,.0f} SAR/sqm, "
+                     f"median {stats['median_price_per_sqm']:,.0f} SAR/sqm, "
+                     f"middle half {stats['price_per_sqm_quantiles'][0.25]:,.0f}-{stats['price_per_sqm_quantiles'][0.75]:,.0f} SAR/sqm, "
+                     f"median ROI {stats['median_roi']:.1f}%")
+    return "\n".join(lines)
+
+# Investment ranking criteria and their default weights
+INVESTMENT_WEIGHTS = {"roi": 3, "value": 2, "safety": 1, "quality": 1}
+# Number of ranked investment properties listed in the comparison table
+INVESTMENT_TABLE_SIZE = 50
+
+# Function to score every listing on each investment criterion, scaled to 0-1 (higher is better)
+def investment_components(store):
+    registry = load_area_registry()
+    n_areas = len(store["area_labels"])
+    
+    # ROI relative to the catalog's range
+    roi = store["roi"]
+    roi_span = roi.max() - roi.min() if store["size"] else 0
+    roi_score = (roi - roi.min()) / roi_span if roi_span > 0 else np.full(store["size"], 0.5)
+    
+    # Price per sqm against the listing's area median: at the median scores 0.5, half price scores 1
+    price_per_sqm = store["price"] / np.maximum(store["size_sqm"], 1)
+    area_median = np.ones(n_areas)
+    for (code, type_code), stats in store["price_stats"].items():
+        if type_code == -1:
+            area_median[code] = stats["median_price_per_sqm"]
+    value_score = np.clip(1.5 - price_per_sqm / area_median[store["area_code"]], 0, 1)
+    
+    # Area-level safety and quality from the registry; areas without data score neutral
+    area_safety = np.full(n_areas, 0.5)
+    area_quality = np.full(n_areas, 0.5)
+    n_known = min(n_areas, len(registry["names"]))
+    area_safety[:n_known] = np.where(registry["has_risk"][:n_known], 1 - registry["risk"][:n_known].mean(axis=1) / 100, 0.5)
+    area_quality[:n_known] = np.where(registry["has_quality"][:n_known], registry["quality"][:n_known].mean(axis=1) / 100, 0.5)
+    
+    return {
+        "roi": roi_score,
+        "value": value_score,
+        "safety": area_safety[store["area_code"]],
+        "quality": area_quality[store["area_code"]]
+    }
+
+# Function to blend the investment criteria into one 0-100 score per listing
+def investment_scores(store, weights, components=None):
+    components = components or investment_components(store)
+    total_weight = sum(weights.values())
+    if total_weight == 0:
+        return np.zeros(store["size"])
+    return 100 * sum(weight * components[name] for name, weight in weights.items()) / total_weight
+
+# Weight of each listing attribute in the comparables distance
+COMPARABLE_WEIGHTS = {"size": 1.0, "bedrooms": 0.7, "bathrooms": 0.5, "type": 1.5, "location": 1.0, "price": 1.0}
+# Distance (km) that counts as much as one standard deviation of the other attributes
+COMPARABLE_LOCATION_KM = 5.0
+
+# Function to build the normalized float32 feature matrix used to find comparable listings
+def comparable_features(store):
+    def standardized(values):
+        values = values.astype(np.float64)
+        spread = values.std()
+        return (values - values.mean()) / spread if spread > 0 else values * 0
+    
+    # Locations are turned into km offsets so both axes are on the same scale
+    lat_km = (store["lat"] - store["lat"].mean()) * 111.32
+    lng_km = (store["lng"] - store["lng"].mean()) * 111.32 * np.cos(np.radians(store["lat"].mean()))
+    # One-hot property types, scaled so a type mismatch adds exactly the type weight
+    types = np.zeros((store["size"], len(store["type_labels"])))
+    types[np.arange(store["size"]), store["type_code"]] = COMPARABLE_WEIGHTS["type"] / np.sqrt(2)
+    
+    columns = [
+        COMPARABLE_WEIGHTS["size"] * standardized(np.log(np.maximum(store["size_sqm"], 1))),
+        COMPARABLE_WEIGHTS["bedrooms"] * standardized(store["bedrooms"]),
+        COMPARABLE_WEIGHTS["bathrooms"] * standardized(store["bathrooms"]),
+        COMPARABLE_WEIGHTS["location"] * lat_km / COMPARABLE_LOCATION_KM,
+        COMPARABLE_WEIGHTS["location"] * lng_km / COMPARABLE_LOCATION_KM,
+        COMPARABLE_WEIGHTS["price"] * standardized(np.log(np.maximum(store["price"], 1)))
+    ]
+    return np.column_stack(columns + [types]).astype(np.float32)
+
+# Function to get the comparables index, rebuilding it only after listings were added or edited
+def comparables_index(store):
+    stamp = (store["size"], int(store["version"].sum()))
+    index = store.get("comparables_index")
+    if index is None or index["stamp"] != stamp:
+        features = comparable_features(store)
+        # Squared norms turn nearest-neighbour search into one matrix product
+        index = {"stamp": stamp, "features": features, "norms": np.einsum("ij,ij->i", features, features)}
+        store["comparables_index"] = index
+    return index
+
+# Function to find the k listings most similar to one listing row, with their distances
+def find_comparables(store, row, k=3):
+    if store["size"] < 2:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    index = comparables_index(store)
+    features, norms = index["features"], index["norms"]
+    distances = norms - 2 * (features @ features[row]) + norms[row]
+    distances[row] = np.inf
+    rows = top_scored_rows(np.arange(store["size"]), -distances, min(k, store["size"] - 1))
+    return rows, np.sqrt(np.maximum(distances[rows], 0))
+
+# Function to find the k most similar listings for many rows at once (e.g. the whole catalog offline)
+def batch_comparables(store, rows=None, k=3, block_size=1024):
+    index = comparables_index(store)
+    features, norms = index["features"], index["norms"]
+    rows = np.arange(store["size"]) if rows is None else np.asarray(rows, dtype=np.int64)
+    k = min(k, store["size"] - 1)
+    neighbours = np.zeros((len(rows), k), dtype=np.int64)
+    neighbour_distances = np.zeros((len(rows), k), dtype=np.float32)
+    
+    # Query rows are processed in blocks so the distance matrix stays small
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        distances = norms[block, None] - 2 * (features[block] @ features.T) + norms[None, :]
+        distances[np.arange(len(block)), block] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind="stable")
+        neighbours[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        neighbour_distances[start:start + len(block)] = np.sqrt(np.maximum(np.take_along_axis(nearest_distances, order, axis=1), 0))
+    
+    return neighbours, neighbour_distances
+
+# Valuation model coefficients are fitted offline (python app.py --fit-valuation-model) and saved here
+VALUATION_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "valuation_model.npz")
+# Number of most common listing features the valuation model gets an indicator for
+VALUATION_MAX_FEATURES = 20
+
+# Function to build valuation model inputs; labels the model has not seen contribute nothing
+def valuation_design_matrix(model, size_sqm, bedrooms, bathrooms, types, areas, lat, lng, features):
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    types = np.asarray(types)
+    areas = np.asarray(areas)
+    columns = [
+        np.ones(len(lat)),
+        np.log(np.maximum(np.asarray(size_sqm, dtype=np.float64), 1)),
+        np.asarray(bedrooms, dtype=np.float64),
+        np.asarray(bathrooms, dtype=np.float64),
+        # Coordinates as km offsets from the training catalog's center
+        (lat - model["lat_origin"]) * 111.32,
+        (lng - model["lng_origin"]) * 111.32 * np.cos(np.radians(model["lat_origin"]))
+    ]
+    columns += [types == label for label in model["type_labels"]]
+    columns += [areas == label for label in model["area_labels"]]
+    columns += [np.array([name in listing_features for listing_features in features], dtype=bool) for name in model["feature_names"]]
+    return np.column_stack(columns).astype(np.float64)
+
+# Function to build valuation inputs for listing rows of the store
+def listing_design_matrix(model, store, rows):
+    return valuation_design_matrix(
+        model, store["size_sqm"][rows], store["bedrooms"][rows], store["bathrooms"][rows],
+        np.array(store["type_labels"])[store["type_code"][rows]], np.array(store["area_labels"])[store["area_code"][rows]],
+        store["lat"][rows], store["lng"][rows], [store["features"][row] for row in rows]
+    )
+
+# Function to fingerprint the catalog a valuation model is fitted on; any change to the training data changes it
+def valuation_fingerprint(store):
+    digest = hashlib.sha256()
+    digest.update(f"{store['size']}|{'|'.join(store['type_labels'])}|{'|'.join(store['area_labels'])}".encode())
+    for name in ("price", "size_sqm", "bedrooms", "bathrooms", "type_code", "area_code", "lat", "lng"):
+        digest.update(np.ascontiguousarray(store[name]).tobytes())
+    digest.update("\n".join("|".join(listing_features) for listing_features in store["features"]).encode())
+    return digest.hexdigest()
+
+# Function to fit the valuation model: ridge regression of log price on the listing columns
+def fit_valuation_model(store, alpha=1.0):
+    feature_counts = {}
+    for listing_features in store["features"]:
+        for name in listing_features:
+            feature_counts[name] = feature_counts.get(name, 0) + 1
+    
+    model = {
+        "type_labels": np.array(store["type_labels"]),
+        "area_labels": np.array(store["area_labels"]),
+        "feature_names": np.array(sorted(feature_counts, key=lambda name: (-feature_counts[name], name))[:VALUATION_MAX_FEATURES]),
+        "lat_origin": float(store["lat"].mean()),
+        "lng_origin": float(store["lng"].mean()),
+        "fingerprint": valuation_fingerprint(store)
+    }
+    rows = np.arange(store["size"])
+    X = listing_design_matrix(model, store, rows)
+    y = np.log(np.maximum(store["price"], 1))
+    
+    # The intercept is left unpenalized
+    penalty = alpha * np.eye(X.shape[1])
+    penalty[0, 0] = 0
+    model["coefficients"] = np.linalg.solve(X.T @ X + penalty, X.T @ y)
+    return model
+
+# Function to write fitted valuation coefficients to disk
+def save_valuation_model(model, path=VALUATION_MODEL_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **model)
+
+# Function to read fitted valuation coefficients from disk
+def read_valuation_model(path=VALUATION_MODEL_PATH):
+    with np.load(path) as data:
+        model = {name: data[name] for name in data.files}
+    model["lat_origin"] = float(model["lat_origin"])
+    model["lng_origin"] = float(model["lng_origin"])
+    model["fingerprint"] = str(model["fingerprint"])
+    return model
+
+# Function to get a valuation model for the store's catalog: the saved one if it was fitted on exactly
+# this catalog, otherwise an in-memory fit (serving never writes the file; the offline job does)
+def valuation_model_for(store):
+    if os.path.exists(VALUATION_MODEL_PATH):
+        try:
+            model = read_valuation_model()
+            if model["fingerprint"] == valuation_fingerprint(store):
+                return model
+        except (OSError, KeyError, ValueError):
+            pass
+    return fit_valuation_model(store)
+
+# Offline job: fit the valuation model on the current catalog and save it for serving
+def fit_and_save_valuation_model():
+    store = load_listing_store()
+    model = fit_valuation_model(store)
+    save_valuation_model(model)
+    print(f"Saved valuation model for {store['size']} listings to {VALUATION_MODEL_PATH}")
+
+# Valuation model, loaded lazily and refitted only after listings were added or edited
+def load_valuation_model():
+    store = load_listing_store()
+    stamp = (store["size"], int(store["version"].sum()))
+    cached = store.get("valuation_model")
+    if cached is None or cached["stamp"] != stamp:
+        cached = {"stamp": stamp, "model": valuation_model_for(store)}
+        store["valuation_model"] = cached
+    return cached["model"]
+
+# Function to predict prices for many listing rows in one pass
+def predict_listing_prices(model, store, rows=None):
+    rows = np.arange(store["size"]) if rows is None else np.asarray(rows, dtype=np.int64)
+    return np.exp(listing_design_matrix(model, store, rows) @ model["coefficients"])
+
+# Function to predict the price of a single property dict
+def predict_property_price(model, prop):
+    X = valuation_design_matrix(model, [prop["size_sqm"]], [prop["bedrooms"]], [prop["bathrooms"]], [prop["type"]], [prop["area"]],
+                                [prop["location"]["lat"]], [prop["location"]["lng"]], [prop["features"]])
+    return float(np.exp(X[0] @ model["coefficients"]))
+
+# Spatial grid cell size in degrees (about 1.1 km of latitude)
+GEO_CELL_DEGREES = 0.01
+GEO_GRID_ROWS = int(180 / GEO_CELL_DEGREES) + 1
+EARTH_RADIUS_KM = 6371.0
+
+# Function to compute grid cell keys; cells of one longitude column are contiguous in key order
+def geo_cell_keys(lat, lng):
+    column = np.floor((np.asarray(lng, dtype=np.float64) + 180) / GEO_CELL_DEGREES).astype(np.int64)
+    row = np.floor((np.asarray(lat, dtype=np.float64) + 90) / GEO_CELL_DEGREES).astype(np.int64)
+    return column * GEO_GRID_ROWS + row
+
+# Function to compute great-circle distances in km (broadcasts over arrays)
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(np.radians, (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+# Function to find listing rows inside a bounding box using the spatial grid
+def listings_in_bbox(store, south, west, north, east, max_columns=2000):
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    first_column, first_row = divmod(int(geo_cell_keys(south, west)), GEO_GRID_ROWS)
+    last_column, last_row = divmod(int(geo_cell_keys(north, east)), GEO_GRID_ROWS)
+    
+    if last_column - first_column + 1 > max_columns:
+        # Very wide boxes touch most of the grid anyway, so scan the columns directly
+        candidates = np.arange(store["size"])
+    else:
+        # Each longitude column of the box is one contiguous run of the cell-ordered rows
+        columns = np.arange(first_column, last_column + 1, dtype=np.int64) * GEO_GRID_ROWS
+        starts = np.searchsorted(store["geo_sorted_cells"], columns + first_row, side="left")
+        ends = np.searchsorted(store["geo_sorted_cells"], columns + last_row, side="right")
+        candidates = np.concatenate([store["geo_order"][start:end] for start, end in zip(starts, ends)] or [np.zeros(0, dtype=np.int64)])
+    
+    # Edge cells overlap the box only partly, so finish with an exact test
+    lat = store["lat"][candidates]
+    lng = store["lng"][candidates]
+    inside = (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+    return np.sort(candidates[inside])
+
+# Function to find listing rows within a radius, nearest first, with their distances in km
+def listings_within_radius(store, lat, lng, radius_km):
+    lat_span = np.degrees(radius_km / EARTH_RADIUS_KM)
+    lng_span = lat_span / max(np.cos(np.radians(lat)), 1e-6)
+    candidates = listings_in_bbox(store, lat - lat_span, lng - lng_span, lat + lat_span, lng + lng_span)
+    
+    distances = haversine_km(lat, lng, store["lat"][candidates], store["lng"][candidates])
+    inside = distances <= radius_km
+    candidates, distances = candidates[inside], distances[inside]
+    order = np.argsort(distances, kind="stable")
+    return candidates[order], distances[order]
+
+# Function to find the k listing rows nearest to a point, with their distances in km
+def nearest_listings(store, lat, lng, k, start_radius_km=1.0):
+    k = min(k, store["size"])
+    radius_km = start_radius_km
+    # Grow the search circle until it holds k listings; every closer listing is then inside it
+    while radius_km < np.pi * EARTH_RADIUS_KM:
+        rows, distances = listings_within_radius(store, lat, lng, radius_km)
+        if len(rows) >= k:
+            return rows[:k], distances[:k]
+        radius_km *= 2
+    
+    distances = haversine_km(lat, lng, store["lat"], store["lng"])
+    rows = np.argsort(distances, kind="stable")[:k]
+    return rows, distances[rows]
+
+# Function to compute the bounding box (south, west, north, east) a web map shows at a zoom level
+def map_viewport(lat, lng, zoom, width_px=700, height_px=500):
+    # Web maps use 256 px tiles, so one pixel spans 360 / (256 * 2^zoom) degrees of longitude
+    degrees_per_px = 360 / (256 * 2 ** zoom)
+    lng_half = width_px * degrees_per_px / 2
+    lat_half = height_px * degrees_per_px * np.cos(np.radians(lat)) / 2
+    return lat - lat_half, lng - lng_half, lat + lat_half, lng + lng_half
+
+# Zoom levels with precomputed marker clusters; closer zooms plot individual listings
+CLUSTER_ZOOM_TIERS = [8, 10, 12, 14]
+# Width of one cluster cell in screen pixels at its zoom tier
+CLUSTER_CELL_PX = 64
+
+# Function to compute cluster cell keys for a zoom tier
+def cluster_cell_keys(zoom, lat, lng):
+    size = 360 * CLUSTER_CELL_PX / (256 * 2 ** zoom)
+    column = np.floor((np.asarray(lng, dtype=np.float64) + 180) / size).astype(np.int64)
+    row = np.floor((np.asarray(lat, dtype=np.float64) + 90) / size).astype(np.int64)
+    return column * (int(180 / size) + 1) + row
+
+# Function to recompute count, centroid and median price for some cluster cells of a tier
+def refresh_clusters(store, tier, cells):
+    cells = np.unique(cells)
+    starts = np.searchsorted(tier["sorted_cells"], cells, side="left")
+    counts = np.searchsorted(tier["sorted_cells"], cells, side="right") - starts
+    
+    # Gather the rows of every touched cell, labelled by cell
+    cell_index = np.repeat(np.arange(len(cells)), counts)
+    offsets = np.cumsum(counts) - counts
+    rows = tier["order"][starts[cell_index] + np.arange(len(cell_index)) - offsets[cell_index]]
+    lat = np.bincount(cell_index, weights=store["lat"][rows], minlength=len(cells)) / np.maximum(counts, 1)
+    lng = np.bincount(cell_index, weights=store["lng"][rows], minlength=len(cells)) / np.maximum(counts, 1)
+    
+    # Sorting prices within each cell puts its median in the middle of the cell's run
+    prices = store["price"][rows]
+    prices = prices[np.lexsort((prices, cell_index))]
+    nonempty = counts > 0
+    low = offsets[nonempty] + (counts[nonempty] - 1) // 2
+    high = offsets[nonempty] + counts[nonempty] // 2
+    median_price = (prices[low] + prices[high]) / 2
+    
+    # Replace the touched cells' old aggregates; emptied cells drop out
+    keep = ~np.isin(tier["cluster_cells"], cells)
+    cluster_cells = np.concatenate([tier["cluster_cells"][keep], cells[nonempty]])
+    position = np.argsort(cluster_cells, kind="stable")
+    return dict(tier,
+                cluster_cells=cluster_cells[position],
+                count=np.concatenate([tier["count"][keep], counts[nonempty]])[position],
+                lat=np.concatenate([tier["lat"][keep], lat[nonempty]])[position],
+                lng=np.concatenate([tier["lng"][keep], lng[nonempty]])[position],
+                median_price=np.concatenate([tier["median_price"][keep], median_price])[position])
+
+# Function to return the marker clusters whose centroid falls inside a bounding box
+def map_clusters(store, zoom, south, west, north, east):
+    # Use the finest tier that is not finer than the map's zoom
+    tiers = [tier for tier in CLUSTER_ZOOM_TIERS if tier <= zoom] or CLUSTER_ZOOM_TIERS[:1]
+    tier = store["clusters"][tiers[-1]]
+    inside = (tier["lat"] >= south) & (tier["lat"] <= north) & (tier["lng"] >= west) & (tier["lng"] <= east)
+    return pd.DataFrame({
+        "lat": tier["lat"][inside],
+        "lng": tier["lng"][inside],
+        "count": tier["count"][inside],
+        "median_price": tier["median_price"][inside]
+    })
+
 # Helper function to get risk level
 def get_risk_level(value):
     if value < 30:
@@ -686,7 +1931,7 @@ def get_risk_level(value):
 
 # Function to visualize environmental risks
 def plot_environmental_risks(area):
-    risks = next((r for r in load_risk_data() if r["name"] == area), None)
+    risks = get_area_risks(area)
     
     if not risks:
         st.write("No risk data available for this area.")
@@ -729,7 +1974,7 @@ def plot_environmental_risks(area):
 
 # Function to visualize neighborhood quality
 def plot_neighborhood_quality(area):
-    neighborhood = next((n for n in load_neighborhoods() if n["name"] == area), None)
+    neighborhood = get_area_quality(area)
     
     if not neighborhood:
         st.write("No neighborhood data available for this area.")
@@ -774,67 +2019,409 @@ def plot_neighborhood_quality(area):
     return fig
 
 # Function to calculate mortgage
+# Arguments may be scalars or broadcastable arrays; every scenario is computed at once
 def calculate_mortgage(property_price, down_payment_percent, interest_rate, loan_years):
+    property_price, down_payment_percent, interest_rate, loan_years = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in (property_price, down_payment_percent, interest_rate, loan_years)])
     loan_amount = property_price * (1 - down_payment_percent / 100)
     monthly_interest = interest_rate / 100 / 12
     num_payments = loan_years * 12
     
-    monthly_payment = loan_amount * (monthly_interest * (1 + monthly_interest) ** num_payments) / ((1 + monthly_interest) ** num_payments - 1)
+    # A zero rate has no annuity factor: the loan is simply split evenly over the payments
+    growth = (1 + monthly_interest) ** num_payments
+    with np.errstate(divide="ignore", invalid="ignore"):
+        monthly_payment = np.where(monthly_interest == 0, loan_amount / num_payments,
+                                   loan_amount * (monthly_interest * growth) / (growth - 1))
     
     total_payment = monthly_payment * num_payments
     total_interest = total_payment - loan_amount
     
+    # [()] turns results for scalar inputs back into plain numbers
     return {
-        "loan_amount": loan_amount,
-        "monthly_payment": monthly_payment,
-        "total_payment": total_payment,
-        "total_interest": total_interest
+        "loan_amount": loan_amount[()],
+        "monthly_payment": monthly_payment[()],
+        "total_payment": total_payment[()],
+        "total_interest": total_interest[()]
     }
 
-# Function to display property card
-def display_property_card(prop, show_button=True, button_text="View Details"):
-    with st.container():
-        st.markdown(f"""
-        <div class="property-card">
-            <div style="background-color:#f0f0f0; height:200px; border-radius:5px; display:flex; 
-            justify-content:center; align-items:center; margin-bottom:15px;">
-            <p style="color:#505050;">Property Image</p>
+# Function to build monthly and yearly amortization schedules in closed form
+# Scenarios broadcast like calculate_mortgage; the month axis is appended last and
+# sized by the longest term, with months past a shorter term left at zero
+def amortization_schedule(loan_amount, interest_rate, loan_years):
+    loan_amount, interest_rate, loan_years = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in (loan_amount, interest_rate, loan_years)])
+    monthly_payment = np.asarray(calculate_mortgage(loan_amount, 0, interest_rate, loan_years)["monthly_payment"])
+    monthly_interest_rate = (interest_rate / 100 / 12)[..., None]
+    num_payments = (loan_years * 12)[..., None]
+    max_years = int(loan_years.max()) if loan_years.size else 0
+    months = np.arange(max_years * 12 + 1, dtype=np.float64)
+    
+    # Balance after k payments: L * (g^n - g^k) / (g^n - 1), or L * (1 - k/n) at a zero rate
+    growth = 1 + monthly_interest_rate
+    with np.errstate(divide="ignore", invalid="ignore"):
+        balance = np.where(monthly_interest_rate == 0, 1 - months / num_payments,
+                           (growth ** num_payments - growth ** months) / (growth ** num_payments - 1))
+    balance = np.clip(balance, 0, None) * loan_amount[..., None]
+    balance = np.where(months <= num_payments, balance, 0)
+    
+    # Cumulative principal is the drop in balance; cumulative interest is whatever was paid on top of it
+    paid_months = np.minimum(months, num_payments)
+    cumulative_principal = loan_amount[..., None] - balance
+    cumulative_interest = paid_months * monthly_payment[..., None] - cumulative_principal
+    
+    # Yearly figures are the differences of the cumulative totals at year boundaries
+    year_ends = months[::12]
+    yearly_principal = np.diff(cumulative_principal[..., ::12], axis=-1)
+    yearly_interest = np.diff(cumulative_interest[..., ::12], axis=-1)
+    
+    return {
+        "monthly_payment": monthly_payment[()],
+        "monthly_principal": np.diff(cumulative_principal, axis=-1),
+        "monthly_interest": np.diff(cumulative_interest, axis=-1),
+        "monthly_balance": balance[..., 1:],
+        "years": year_ends[1:] / 12,
+        "yearly_principal": yearly_principal,
+        "yearly_interest": yearly_interest,
+        "yearly_balance": balance[..., ::12][..., 1:]
+    }
+
+# Balance below which a loan counts as settled (SAR)
+PREPAYMENT_SETTLED_BALANCE = 0.01
+
+# Function to simulate prepayment strategies against a level-payment loan
+# All arguments broadcast into a grid of strategies that is stepped month by month together;
+# lump_month is the payment number the lump sum is made with, and reduce_term selects whether
+# extra payments shorten the loan (True) or lower the remaining monthly payment (False)
+def simulate_prepayments(loan_amount, interest_rate, loan_years, lump_sum=0, lump_month=12, extra_monthly=0, reduce_term=True):
+    loan_amount, interest_rate, loan_years, lump_sum, lump_month, extra_monthly, reduce_term = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in (loan_amount, interest_rate, loan_years, lump_sum, lump_month, extra_monthly)],
+        np.asarray(reduce_term, dtype=bool))
+    monthly_interest_rate = interest_rate / 100 / 12
+    num_payments = loan_years * 12
+    scheduled_payment = np.asarray(calculate_mortgage(loan_amount, 0, interest_rate, loan_years)["monthly_payment"])
+    baseline_interest = scheduled_payment * num_payments - loan_amount
+    
+    balance = loan_amount.copy()
+    payment = scheduled_payment.copy()
+    total_interest = np.zeros_like(balance)
+    total_regular = np.zeros_like(balance)
+    total_extra = np.zeros_like(balance)
+    payoff_months = num_payments.copy()
+    
+    for month in range(1, int(num_payments.max()) + 1 if num_payments.size else 1):
+        active = balance > PREPAYMENT_SETTLED_BALANCE
+        if not active.any():
+            break
+        
+        # Regular payment, capped at what is still owed
+        month_interest = np.where(active, balance * monthly_interest_rate, 0)
+        month_principal = np.where(active, np.minimum(payment - month_interest, balance), 0)
+        balance = balance - month_principal
+        
+        # Extra payments go straight to principal
+        extra = extra_monthly + np.where(lump_month == month, lump_sum, 0)
+        extra = np.where(active, np.clip(extra, 0, balance), 0)
+        balance = balance - extra
+        
+        total_interest += month_interest
+        total_regular += month_interest + month_principal
+        total_extra += extra
+        payoff_months = np.where(active & (balance <= PREPAYMENT_SETTLED_BALANCE), month, payoff_months)
+        
+        # In payment-reduction mode, re-amortize what is left over the remaining original term
+        remaining_payments = num_payments - month
+        reamortize = ~reduce_term & (extra > 0) & (remaining_payments > 0) & (balance > PREPAYMENT_SETTLED_BALANCE)
+        if reamortize.any():
+            payment = np.where(reamortize, np.asarray(calculate_mortgage(balance, 0, interest_rate, np.maximum(remaining_payments, 1) / 12)["monthly_payment"]), payment)
+    
+    start_month = np.datetime64(datetime.now().strftime("%Y-%m"), "M")
+    
+    return {
+        "scheduled_payment": scheduled_payment[()],
+        # Regular monthly payment averaged over the life of the loan, extra payments excluded
+        "average_payment": (total_regular / np.maximum(payoff_months, 1))[()],
+        "total_interest": total_interest[()],
+        "interest_saved": (baseline_interest - total_interest)[()],
+        "total_extra": total_extra[()],
+        "payoff_months": payoff_months.astype(int)[()],
+        "months_saved": (num_payments - payoff_months).astype(int)[()],
+        "payoff_date": (start_month + payoff_months.astype(int))[()]
+    }
+
+# Iterations of the bisection that turns a flat Murabaha profit rate into an effective annual rate
+MURABAHA_APR_ITERATIONS = 60
+
+# Function to price Sharia-compliant products alongside calculate_mortgage (arguments broadcast the same way)
+# Murabaha: the bank sells the property at cost plus a flat profit of rate x years on the financed amount,
+# repaid in equal installments. Ijara: the bank leases the property with rent set to amortize its cost at the
+# profit rate, transferring ownership with the last payment
+def calculate_islamic_financing(financed_amount, profit_rate, years):
+    financed_amount, profit_rate, years = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in (financed_amount, profit_rate, years)])
+    num_payments = years * 12
+    
+    murabaha_profit = financed_amount * profit_rate / 100 * years
+    murabaha_sale_price = financed_amount + murabaha_profit
+    murabaha_installment = murabaha_sale_price / num_payments
+    
+    # Effective annual rate of the Murabaha: the rate whose annuity payment equals the flat installment
+    low = np.zeros_like(profit_rate)
+    high = profit_rate * 2 + 1
+    for _ in range(MURABAHA_APR_ITERATIONS):
+        middle = (low + high) / 2
+        too_low = np.asarray(calculate_mortgage(financed_amount, 0, middle, years)["monthly_payment"]) < murabaha_installment
+        low = np.where(too_low, middle, low)
+        high = np.where(too_low, high, middle)
+    
+    ijara = calculate_mortgage(financed_amount, 0, profit_rate, years)
+    
+    return {
+        "murabaha_installment": murabaha_installment[()],
+        "murabaha_profit": murabaha_profit[()],
+        "murabaha_total_payment": murabaha_sale_price[()],
+        "murabaha_effective_rate": ((low + high) / 2)[()],
+        "ijara_rental": ijara["monthly_payment"],
+        "ijara_total_rent": ijara["total_payment"],
+        "ijara_profit": ijara["total_interest"]
+    }
+
+# Function to build yearly Murabaha and Ijara schedules (single scenario)
+# Murabaha profit is recognised on the declining balance at its effective rate; Ijara rent splits into
+# profit and the bank's recovered acquisition cost
+def islamic_financing_schedule(financed_amount, profit_rate, years):
+    islamic = calculate_islamic_financing(financed_amount, profit_rate, years)
+    murabaha = amortization_schedule(financed_amount, islamic["murabaha_effective_rate"], years)
+    ijara = amortization_schedule(financed_amount, profit_rate, years)
+    yearly_installments = islamic["murabaha_installment"] * 12
+    
+    return pd.DataFrame({
+        "Year": ijara["years"].astype(int),
+        "Murabaha Installments": yearly_installments,
+        "Murabaha Profit": murabaha["yearly_interest"],
+        "Murabaha Outstanding": islamic["murabaha_total_payment"] - yearly_installments * ijara["years"],
+        "Ijara Rent": ijara["yearly_principal"] + ijara["yearly_interest"],
+        "Ijara Profit": ijara["yearly_interest"],
+        "Ijara Acquisition Cost Outstanding": ijara["yearly_balance"]
+    })
+
+# Highest share of monthly income lenders allow for the mortgage payment (percent)
+AFFORDABILITY_MAX_DTI = 45
+
+# Function to solve for the highest property price a buyer can finance (arguments broadcast)
+# The loan is capped by the payment the buyer can carry (their own cap and the DTI limit), and by savings,
+# which must cover the bank's minimum down payment plus its processing fee on the loan
+def max_affordable_price(monthly_income, monthly_payment_max, savings, interest_rate, loan_years, min_down_payment, processing_fee=0):
+    monthly_income, monthly_payment_max, savings, interest_rate, loan_years, min_down_payment, processing_fee = np.broadcast_arrays(
+        *[np.asarray(value, dtype=np.float64) for value in (monthly_income, monthly_payment_max, savings, interest_rate, loan_years, min_down_payment, processing_fee)])
+    payment_cap = np.minimum(monthly_payment_max, monthly_income * AFFORDABILITY_MAX_DTI / 100)
+    
+    # Inverse annuity: the loan a level payment repays, or payment x count at a zero rate
+    monthly_interest_rate = interest_rate / 100 / 12
+    num_payments = loan_years * 12
+    with np.errstate(divide="ignore", invalid="ignore"):
+        payment_loan = np.where(monthly_interest_rate == 0, payment_cap * num_payments,
+                                payment_cap * (1 - (1 + monthly_interest_rate) ** -num_payments) / monthly_interest_rate)
+    
+    # With down payment D = savings - fee x loan, requiring D >= d x (D + loan) bounds the loan by savings
+    down_share = min_down_payment / 100
+    fee_share = processing_fee / 100
+    with np.errstate(divide="ignore", invalid="ignore"):
+        savings_loan = np.where(down_share + fee_share * (1 - down_share) > 0,
+                                savings * (1 - down_share) / (down_share + fee_share * (1 - down_share)), np.inf)
+    
+    max_loan = np.maximum(np.minimum(payment_loan, savings_loan), 0)
+    down_payment = np.maximum(savings - fee_share * max_loan, 0)
+    
+    return {
+        "max_price": (max_loan + down_payment)[()],
+        "max_loan": max_loan[()],
+        "down_payment": down_payment[()],
+        "monthly_payment": np.asarray(calculate_mortgage(max_loan, 0, interest_rate, loan_years)["monthly_payment"])[()],
+        "savings_bound": (savings_loan < payment_loan)[()]
+    }
+
+# Function to count the listings priced within each budget, optionally among masked rows only
+# Budgets of any shape are answered together by binary search over the price-ordered index
+def affordable_listing_counts(store, max_prices, mask=None):
+    order = store["sort_orders"]["Price (Low to High)"]
+    prefix_lengths = np.searchsorted(store["price"][order], max_prices, side="right")
+    if mask is None:
+        return prefix_lengths
+    matching_before = np.concatenate([[0], np.cumsum(mask[order])])
+    return matching_before[prefix_lengths]
+
+# Function to return the k most expensive listings within a budget, optionally among masked rows only
+def affordable_listings(store, max_price, k, mask=None):
+    order = store["sort_orders"]["Price (Low to High)"]
+    prefix = order[:np.searchsorted(store["price"][order], max_price, side="right")]
+    if mask is not None:
+        prefix = prefix[mask[prefix]]
+    return prefix[::-1][:k]
+
+# Variable-rate model: the rate resets once a year and mean-reverts to the bank's quoted rate
+RATE_RESET_MONTHS = 12
+RATE_REVERSION_SPEED = 0.35  # per year
+RATE_VOLATILITY = 0.9  # percentage points per sqrt(year)
+RATE_FLOOR = 0.5  # percent
+RATE_SIMULATION_PATHS = 5000
+RATE_SIMULATION_SEED = 2024
+RATE_SIMULATION_PERCENTILES = [5, 25, 50, 75, 95]
+# Paths are simulated in fixed-size chunks with their own seeds, so results are identical with or without a process pool
+RATE_SIMULATION_CHUNK_PATHS = 10000
+# Path count from which chunks are spread across a process pool
+RATE_PARALLEL_MIN_PATHS = 50000
+
+# Function to draw yearly rate paths from an Ornstein-Uhlenbeck process around the base rate
+# Year 1 is always the quoted rate; the exact discretisation keeps the yearly step unbiased
+def simulate_rate_paths(base_rate, loan_years, num_paths, rng):
+    decay = np.exp(-RATE_REVERSION_SPEED)
+    step_std = RATE_VOLATILITY * np.sqrt((1 - decay ** 2) / (2 * RATE_REVERSION_SPEED))
+    shocks = rng.standard_normal((num_paths, max(loan_years - 1, 0))) * step_std
+    
+    # Deviation from the mean follows d_t = d_{t-1} * decay + shock_t, a linear recurrence
+    # solved with a cumulative sum of decay-scaled shocks
+    powers = decay ** np.arange(1, loan_years)
+    deviations = np.cumsum(shocks / powers, axis=1) * powers
+    rates = np.concatenate([np.zeros((num_paths, 1)), deviations], axis=1) + base_rate
+    return np.maximum(rates, RATE_FLOOR)
+
+# Function to pay a loan down along many rate paths at once, re-amortizing at each yearly reset
+def variable_rate_payments(loan_amount, rate_paths, loan_years):
+    num_paths = rate_paths.shape[0]
+    balance = np.full(num_paths, float(loan_amount))
+    payments = np.empty((num_paths, loan_years))
+    
+    for year in range(loan_years):
+        remaining_years = loan_years - year
+        payments[:, year] = calculate_mortgage(balance, 0, rate_paths[:, year], remaining_years)["monthly_payment"]
+        
+        # Balance after a year of level payments, in closed form
+        monthly_interest_rate = rate_paths[:, year] / 100 / 12
+        growth = (1 + monthly_interest_rate) ** RATE_RESET_MONTHS
+        with np.errstate(divide="ignore", invalid="ignore"):
+            balance = np.where(monthly_interest_rate == 0, balance - payments[:, year] * RATE_RESET_MONTHS,
+                               balance * growth - payments[:, year] * (growth - 1) / monthly_interest_rate)
+        balance = np.maximum(balance, 0)
+    
+    return payments
+
+# Helper function to simulate one chunk of paths (module level so a process pool can run it)
+def variable_rate_chunk(loan_amount, base_rate, loan_years, num_paths, seed_sequence):
+    rate_paths = simulate_rate_paths(base_rate, loan_years, num_paths, np.random.default_rng(seed_sequence))
+    payments = variable_rate_payments(loan_amount, rate_paths, loan_years)
+    return payments, payments.sum(axis=1) * RATE_RESET_MONTHS
+
+# Function to run the Monte Carlo variable-rate simulation and summarise it as percentile bands
+# Large runs go to a process pool when the worker can be sent to one; otherwise the chunks run in this
+# process. Under `streamlit run` the script is not an importable module, so the pool is only used when
+# the simulation is called from an imported copy of this file (e.g. offline jobs)
+def simulate_variable_rate_mortgage(loan_amount, base_rate, loan_years, num_paths=RATE_SIMULATION_PATHS, seed=RATE_SIMULATION_SEED, workers=None):
+    loan_years = int(loan_years)
+    chunk_sizes = [RATE_SIMULATION_CHUNK_PATHS] * (num_paths // RATE_SIMULATION_CHUNK_PATHS)
+    if num_paths % RATE_SIMULATION_CHUNK_PATHS:
+        chunk_sizes.append(num_paths % RATE_SIMULATION_CHUNK_PATHS)
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    chunk_args = [(loan_amount, base_rate, loan_years, size, sequence) for size, sequence in zip(chunk_sizes, seed_sequences)]
+    
+    workers = workers or os.cpu_count() or 1
+    results = None
+    if num_paths >= RATE_PARALLEL_MIN_PATHS and workers > 1 and len(chunk_args) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunk_args))) as executor:
+                results = list(executor.map(variable_rate_chunk, *zip(*chunk_args)))
+        except (BrokenProcessPool, pickle.PicklingError, OSError):
+            results = None
+    if results is None:
+        results = [variable_rate_chunk(*args) for args in chunk_args]
+    
+    payments = np.concatenate([chunk[0] for chunk in results])
+    total_costs = np.concatenate([chunk[1] for chunk in results])
+    fixed = calculate_mortgage(loan_amount, 0, base_rate, loan_years)
+    
+    return {
+        "percentiles": RATE_SIMULATION_PERCENTILES,
+        "years": np.arange(1, loan_years + 1),
+        "payment_bands": np.percentile(payments, RATE_SIMULATION_PERCENTILES, axis=0),
+        "total_cost_bands": np.percentile(total_costs, RATE_SIMULATION_PERCENTILES),
+        "max_payment_bands": np.percentile(payments.max(axis=1), RATE_SIMULATION_PERCENTILES),
+        "fixed_payment": fixed["monthly_payment"],
+        "fixed_total_cost": fixed["total_payment"],
+        "num_paths": num_paths
+    }
+
+# Rendered property card fragments shared by all sessions, keyed by listing id
+@st.cache_resource
+def load_card_html_cache():
+    return {}
+
+# Function to build the HTML fragment for a property card
+def render_property_card_html(prop, language, model):
+    title = prop.get("title_ar", prop["title"]) if language == "العربية" else prop["title"]
+    estimate = predict_property_price(model, prop)
+    return f"""
+    <div class="property-card">
+        <div style="background-color:#f0f0f0; height:200px; border-radius:5px; display:flex; 
+        justify-content:center; align-items:center; margin-bottom:15px;">
+        <p style="color:#505050;">Property Image</p>
+        </div>
+        <h3>{title}</h3>
+        <p class="property-address">{prop["area"]}, Riyadh</p>
+        <div style="display:flex; justify-content:space-between; align-items:center; margin:10px 0;">
+            <div>
+                <p class="property-price">{prop["price"]:,} SAR</p>
+                <p style="font-size: 13px; color: #666; margin: 0;">Est. value {estimate:,.0f} SAR ({(estimate - prop["price"]) / prop["price"]:+.0%} vs asking)</p>
             </div>
-            <h3>{prop["title"]}</h3>
-            <p class="property-address">{prop["area"]}, Riyadh</p>
-            <div style="display:flex; justify-content:space-between; align-items:center; margin:10px 0;">
-                <div>
-                    <p class="property-price">{prop["price"]:,} SAR</p>
-                </div>
-                <div>
-                    <span style="background-color:#e6f4ff; color:#1e3c72; padding:5px 10px; border-radius:4px; font-size:14px;">
-                        {"✓ Verified" if prop.get("verified", False) else "Pending Verification"}
-                    </span>
-                </div>
+            <div>
+                <span style="background-color:#e6f4ff; color:#1e3c72; padding:5px 10px; border-radius:4px; font-size:14px;">
+                    {"✓ Verified" if prop.get("verified", False) else "Pending Verification"}
+                </span>
             </div>
-            <div class="property-features">
-                <div class="property-feature">
-                    <i class="fas fa-bed property-feature-icon"></i>
-                    <span>{prop["bedrooms"]} Beds</span>
-                </div>
-                <div class="property-feature">
-                    <i class="fas fa-bath property-feature-icon"></i>
-                    <span>{prop["bathrooms"]} Baths</span>
-                </div>
-                <div class="property-feature">
-                    <i class="fas fa-ruler-combined property-feature-icon"></i>
-                    <span>{prop["size_sqm"]} m²</span>
-                </div>
-                <div class="property-feature">
-                    <i class="fas fa-star property-feature-icon"></i>
-                    <span>{prop.get("rating", 4.0)}</span>
-                </div>
+        </div>
+        <div class="property-features">
+            <div class="property-feature">
+                <i class="fas fa-bed property-feature-icon"></i>
+                <span>{prop["bedrooms"]} Beds</span>
+            </div>
+            <div class="property-feature">
+                <i class="fas fa-bath property-feature-icon"></i>
+                <span>{prop["bathrooms"]} Baths</span>
+            </div>
+            <div class="property-feature">
+                <i class="fas fa-ruler-combined property-feature-icon"></i>
+                <span>{prop["size_sqm"]} m²</span>
+            </div>
+            <div class="property-feature">
+                <i class="fas fa-star property-feature-icon"></i>
+                <span>{prop.get("rating", 4.0)}</span>
             </div>
         </div>
-        """, unsafe_allow_html=True)
+    </div>
+    """
+
+# Function to get a property card fragment, rendering it only when the listing, model or language is new
+def get_property_card_html(prop, language):
+    cache = load_card_html_cache()
+    version = prop.get("version", 0)
+    model = load_valuation_model()
+    
+    # A listing edit bumps its version and a refit changes the model's fingerprint; either drops
+    # every fragment rendered before, so cards always show the current model's estimate
+    entry = cache.get(prop["id"])
+    if entry is None or entry["version"] != version or entry["model"] != model["fingerprint"]:
+        entry = {"version": version, "model": model["fingerprint"], "html": {}}
+        cache[prop["id"]] = entry
+    
+    if language not in entry["html"]:
+        entry["html"][language] = render_property_card_html(prop, language, model)
+    return entry["html"][language]
+
+# Function to display property card
+def display_property_card(prop, show_button=True, button_text="View Details", key_prefix="prop_btn"):
+    with st.container():
+        st.markdown(get_property_card_html(prop, st.session_state.get("language", "English")), unsafe_allow_html=True)
         
         if show_button:
-            if st.button(button_text, key=f"prop_btn_{prop['id']}"):
+            if st.button(button_text, key=f"{key_prefix}_{prop['id']}"):
                 st.session_state.selected_property = prop["id"]
                 if "page" in st.session_state:
                     st.session_state.page = "Property Search"
@@ -1019,13 +2606,13 @@ def show_home():
     # Featured properties
     st.markdown("<h2>Featured Properties</h2>", unsafe_allow_html=True)
     
-    properties = load_properties()
+    store = load_listing_store()
     
     # Show top 3 properties
     cols = st.columns(3)
-    for i, prop in enumerate(properties[:3]):
+    for i in range(min(3, store["size"])):
         with cols[i]:
-            display_property_card(prop)
+            display_property_card(get_listing_view(store, i))
     
     # How it works
     st.markdown("<br><br>", unsafe_allow_html=True)
@@ -1078,6 +2665,30 @@ def show_property_search():
     tabs = st.tabs(["Search by Criteria", "Search by Map", "Search by Investment Potential"])
     
     with tabs[0]:
+        keywords = st.text_input("Keyword Search / البحث بالكلمات", placeholder="e.g. pool, garden, مسبح", key="search_keywords")
+        
+        # Area filter options come from the listings, so every suggested area is selectable
+        store = load_listing_store()
+        area_options = list(store["area_labels"])
+        
+        # Area and feature suggestions for what has been typed, tolerating typos
+        suggestions = suggest_terms(load_suggestion_index((store["size"], int(store["version"].sum()))), keywords, limit=4) if keywords else []
+        if suggestions:
+            cols = st.columns(len(suggestions))
+            for col, suggestion in zip(cols, suggestions):
+                with col:
+                    if suggestion["kind"] == "area":
+                        # Areas become an area filter rather than keywords
+                        st.button(f"Area: {suggestion['label']}", key=f"suggest_{suggestion['value']}", use_container_width=True,
+                                  on_click=lambda value=suggestion["value"]: st.session_state.update({
+                                      "search_area": [option for option in area_options
+                                                      if option in st.session_state.get("search_area", []) or option == value],
+                                      "search_keywords": ""
+                                  }))
+                    else:
+                        st.button(f"Feature: {suggestion['label']}", key=f"suggest_{suggestion['label']}", use_container_width=True,
+                                  on_click=lambda alias=suggestion["alias"]: st.session_state.update({"search_keywords": alias}))
+        
         # Advanced search filters in an expander
         with st.expander("Advanced Search Filters", expanded=True):
             # Search filters in three columns
@@ -1086,14 +2697,18 @@ def show_property_search():
             with col1:
                 min_price = st.number_input("Min Price / الحد الأدنى للسعر", min_value=0, max_value=10000000, step=100000, value=0)
                 bedrooms = st.multiselect("Bedrooms / غرف النوم", options=list(range(1, 6+1)))
+                bedrooms_counts = st.empty()
             
             with col2:
                 max_price = st.number_input("Max Price / الحد الأعلى للسعر", min_value=0, max_value=10000000, step=100000, value=10000000)
                 bathrooms = st.multiselect("Bathrooms / الحمامات", options=list(range(1, 6+1)))
+                bathrooms_counts = st.empty()
             
             with col3:
                 property_type = st.multiselect("Property Type / نوع العقار", options=["Villa", "Apartment", "Penthouse", "House", "Townhouse"])
-                area = st.multiselect("Area / المنطقة", options=["Al Olaya", "Al Nakheel", "Hittin", "Al Malaz", "Al Naseem"])
+                property_type_counts = st.empty()
+                area = st.multiselect("Area / المنطقة", options=area_options, key="search_area")
+                area_counts = st.empty()
             
             # Additional filters
             col1, col2, col3 = st.columns(3)
@@ -1106,69 +2721,156 @@ def show_property_search():
             
             with col3:
                 verified_only = st.checkbox("Verified Properties Only", value=True)
-        
-        # Apply filters
-        properties = load_properties()
-        filtered_properties = properties.copy()
-        
-        if min_price > 0:
-            filtered_properties = [p for p in filtered_properties if p['price'] >= min_price]
-        if max_price < 10000000:
-            filtered_properties = [p for p in filtered_properties if p['price'] <= max_price]
-        if bedrooms:
-            filtered_properties = [p for p in filtered_properties if p['bedrooms'] in bedrooms]
-        if bathrooms:
-            filtered_properties = [p for p in filtered_properties if p['bathrooms'] in bathrooms]
-        if property_type:
-            filtered_properties = [p for p in filtered_properties if p['type'] in property_type]
-        if area:
-            filtered_properties = [p for p in filtered_properties if p['area'] in area]
-        if min_size > 0:
-            filtered_properties = [p for p in filtered_properties if p['size_sqm'] >= min_size]
-        if max_size < 1000:
-            filtered_properties = [p for p in filtered_properties if p['size_sqm'] <= max_size]
-        if verified_only:
-            filtered_properties = [p for p in filtered_properties if p.get('verified', False)]
+                underpriced_only = st.checkbox("Underpriced Only / أقل من سعر السوق", value=False,
+                                               help="Listings priced well below similar properties in the same area. "
+                                                    f"Only judged where the area has at least {FAIR_PRICE_MIN_GROUP} listings of the same type "
+                                                    "with varied prices; other listings never match this filter.")
+        
+        # Apply filters on the shared listing columns (rows are listing positions)
+        query = build_search_query(min_price, max_price, bedrooms, bathrooms, property_type, area, min_size, max_size, verified_only, keywords, underpriced_only)
+        mask = filter_mask(store, query)
+        total = int(np.count_nonzero(mask))
+        
+        # Live per-option counts under each multiselect
+        counts = facet_counts(store, query)
+        for placeholder, key, options in [
+            (bedrooms_counts, "bedrooms", range(1, 6+1)),
+            (bathrooms_counts, "bathrooms", range(1, 6+1)),
+            (property_type_counts, "property_type", ["Villa", "Apartment", "Penthouse", "House", "Townhouse"]),
+            (area_counts, "area", area_options)
+        ]:
+            placeholder.caption(" · ".join(f"{option} ({counts[key].get(option, 0):,})" for option in options))
         
         # Search results
-        st.markdown(f"<h3>Found {len(filtered_properties)} properties / تم العثور على {len(filtered_properties)} عقار</h3>", unsafe_allow_html=True)
+        st.markdown(f"<h3>Found {total} properties / تم العثور على {total} عقار</h3>", unsafe_allow_html=True)
+        
+        # Market prices for the selected areas, from the precomputed area statistics
+        for area_name in area:
+            area_stats = get_price_stats(store, area_name)
+            if area_stats:
+                st.caption(f"{area_name}: median {area_stats['median_price_per_sqm']:,.0f} SAR/sqm "
+                           f"(middle half {area_stats['price_per_sqm_quantiles'][0.25]:,.0f}-{area_stats['price_per_sqm_quantiles'][0.75]:,.0f}) · "
+                           f"median ROI {area_stats['median_roi']:.1f}% · {area_stats['count']} listings")
         
         # Display in grid
-        if filtered_properties:
+        if total:
             # Display sort options
             col1, col2 = st.columns([3, 1])
             with col2:
-                sort_option = st.selectbox("Sort By", ["Price (Low to High)", "Price (High to Low)", "Newest First", "Highest Rated"])
-            
-            # Sort properties based on selection
-            if sort_option == "Price (Low to High)":
-                filtered_properties.sort(key=lambda x: x['price'])
-            elif sort_option == "Price (High to Low)":
-                filtered_properties.sort(key=lambda x: x['price'], reverse=True)
-            elif sort_option == "Newest First":
-                filtered_properties.sort(key=lambda x: x.get('date_added', '2025-01-01'), reverse=True)
-            elif sort_option == "Highest Rated":
-                filtered_properties.sort(key=lambda x: x.get('rating', 4.0), reverse=True)
-            
-            # Display properties in a grid (2 per row)
-            for i in range(0, len(filtered_properties), 2):
+                # Keyword searches can also be ordered by relevance
+                sort_options = ["Price (Low to High)", "Price (High to Low)", "Newest First", "Highest Rated", "Highest ROI"]
+                sort_option = st.selectbox("Sort By", (["Best Match"] if query["keywords"] else []) + sort_options)
+            
+            # Page cursor lives in session state and restarts when the query or sort changes
+            page_count = (total + RESULTS_PAGE_SIZE - 1) // RESULTS_PAGE_SIZE
+            search_signature = repr((query, sort_option))
+            if st.session_state.get("search_signature") != search_signature:
+                st.session_state.search_signature = search_signature
+                st.session_state.search_page = 0
+            page = min(st.session_state.search_page, page_count - 1)
+            
+            # Read only the current page from the presorted index for the selected option
+            if sort_option == "Best Match":
+                rows = rank_listings_text(store, query["keywords"], mask, RESULTS_PAGE_SIZE, page * RESULTS_PAGE_SIZE)
+            else:
+                rows = top_listings(store, mask, sort_option, RESULTS_PAGE_SIZE, page * RESULTS_PAGE_SIZE)
+            
+            # Display properties in a grid (2 per row), building dicts only for rendered cards
+            for i in range(0, len(rows), 2):
                 cols = st.columns(2)
                 for j in range(2):
-                    if i + j < len(filtered_properties):
+                    if i + j < len(rows):
                         with cols[j]:
-                            display_property_card(filtered_properties[i + j])
+                            display_property_card(get_listing_view(store, rows[i + j]))
+            
+            # Pagination controls
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                st.button("← Previous", key="search_prev", disabled=page == 0, use_container_width=True,
+                          on_click=lambda: st.session_state.update({"search_page": page - 1}))
+            with col2:
+                st.markdown(f"<p style='text-align: center; margin-top: 8px;'>Page {page + 1} of {page_count} · showing {page * RESULTS_PAGE_SIZE + 1}-{page * RESULTS_PAGE_SIZE + len(rows)} of {total}</p>", unsafe_allow_html=True)
+            with col3:
+                st.button("Next →", key="search_next", disabled=page >= page_count - 1, use_container_width=True,
+                          on_click=lambda: st.session_state.update({"search_page": page + 1}))
         else:
             st.info("No properties match your search criteria. Try adjusting your filters.")
     
     with tabs[1]:
-        st.markdown("""
-        <div style="background-color:#f0f0f0; height:400px; border-radius:5px; display:flex; 
-        justify-content:center; align-items:center; margin-bottom:15px;">
-            <p style="color:#505050;">Interactive Map View Coming Soon</p>
-        </div>
-        """, unsafe_allow_html=True)
+        store = load_listing_store()
         
-        st.info("Our interactive map search is currently under development. Please check back soon!")
+        col1, col2, col3 = st.columns(3)
+        
+        with col1:
+            map_center = st.selectbox("Map Center / مركز الخريطة", ["All Areas"] + store["area_labels"], key="map_center")
+            zoom = st.slider("Zoom / التكبير", min_value=9, max_value=16, value=12, key="map_zoom")
+        
+        with col2:
+            map_mode = st.radio("Show Listings / عرض العقارات", ["In visible map area", "Within a radius", "Nearest to center"], key="map_mode")
+        
+        with col3:
+            if map_mode == "Within a radius":
+                radius_km = st.slider("Radius (km) / نصف القطر", min_value=0.5, max_value=20.0, value=3.0, step=0.5, key="map_radius")
+            elif map_mode == "Nearest to center":
+                nearest_count = st.number_input("Number of Listings / عدد العقارات", min_value=1, max_value=50, value=5, key="map_nearest")
+        
+        # Center on the chosen area's listings, or on the whole catalog
+        if map_center == "All Areas":
+            center_rows = np.arange(store["size"])
+        else:
+            center_rows = np.flatnonzero(store["area_code"] == store["area_codes"][map_center])
+        
+        if len(center_rows) == 0:
+            st.info("No listings in this area yet.")
+        else:
+            center_lat = float(np.median(store["lat"][center_rows]))
+            center_lng = float(np.median(store["lng"][center_rows]))
+            
+            # Only the listings the current view covers are read from the spatial index
+            if map_mode == "In visible map area":
+                rows = listings_in_bbox(store, *map_viewport(center_lat, center_lng, zoom))
+                distances = haversine_km(center_lat, center_lng, store["lat"][rows], store["lng"][rows])
+                # Only the page of nearest cards needs ordering; the rest of the view stays unsorted
+                nearest = top_scored_rows(np.arange(len(rows)), -distances, RESULTS_PAGE_SIZE)
+                rows = np.concatenate([rows[nearest], np.delete(rows, nearest)])
+                distances = np.concatenate([distances[nearest], np.delete(distances, nearest)])
+            elif map_mode == "Within a radius":
+                rows, distances = listings_within_radius(store, center_lat, center_lng, radius_km)
+            else:
+                rows, distances = nearest_listings(store, center_lat, center_lng, nearest_count)
+            
+            if map_mode == "In visible map area" and zoom <= CLUSTER_ZOOM_TIERS[-1]:
+                # Zoomed-out views plot one marker per cluster, sized by its listing count
+                clusters = map_clusters(store, zoom, *map_viewport(center_lat, center_lng, zoom))
+                clusters["size"] = 60 * np.sqrt(clusters["count"]) * 2 ** (CLUSTER_ZOOM_TIERS[-1] - zoom)
+                st.map(clusters, latitude="lat", longitude="lng", zoom=zoom, size="size", color="#9a86fe")
+                st.caption(f"{len(clusters)} clusters · zoom in past {CLUSTER_ZOOM_TIERS[-1]} to see individual listings")
+                
+                with st.expander("Cluster Details / تفاصيل المجموعات"):
+                    st.dataframe(pd.DataFrame({
+                        "Listings": clusters["count"],
+                        "Median Price (SAR)": clusters["median_price"].map(lambda x: f"{x:,.0f}"),
+                        "Latitude": clusters["lat"].round(4),
+                        "Longitude": clusters["lng"].round(4)
+                    }).sort_values("Listings", ascending=False), hide_index=True, use_container_width=True)
+            else:
+                st.map(pd.DataFrame({"lat": store["lat"][rows], "lng": store["lng"][rows]}),
+                       latitude="lat", longitude="lng", zoom=zoom, size=60, color="#9a86fe")
+            
+            if len(rows) > 0:
+                st.subheader(f"Found {len(rows)} properties on the map")
+                
+                # Cards for the listings closest to the map center
+                shown = min(len(rows), RESULTS_PAGE_SIZE)
+                for i in range(0, shown, 2):
+                    cols = st.columns(2)
+                    for j in range(2):
+                        if i + j < shown:
+                            with cols[j]:
+                                st.caption(f"{distances[i + j]:.1f} km from map center")
+                                display_property_card(get_listing_view(store, rows[i + j]), key_prefix="map_btn")
+            else:
+                st.info("No properties in this part of the map. Try zooming out or widening the radius.")
     
     with tabs[2]:
         st.subheader("Investment Property Search")
@@ -1183,52 +2885,67 @@ def show_property_search():
             areas_investment = st.multiselect("Target Areas", options=["Al Olaya", "Al Nakheel", "Hittin", "Al Malaz", "Al Naseem"], default=["Al Malaz"])
             property_type_inv = st.multiselect("Property Types", options=["Apartment", "Villa", "Townhouse"], default=["Apartment"])
         
-        # Filter properties for investment
-        investment_properties = [p for p in properties if float(p.get('roi_estimate', '5.0%').strip('%')) >= min_roi]
-        investment_properties = [p for p in investment_properties if p['price'] <= max_price_inv]
-        
-        if areas_investment:
-            investment_properties = [p for p in investment_properties if p['area'] in areas_investment]
-        
-        if property_type_inv:
-            investment_properties = [p for p in investment_properties if p['type'] in property_type_inv]
+        # Filter properties for investment: budget, areas and types from the shared listing columns
+        store = load_listing_store()
+        query = build_search_query(property_type=property_type_inv, area=areas_investment)
+        # The budget is a hard cap, even at the widget maximum that build_search_query treats as "no limit"
+        query["max_price"] = max_price_inv
+        mask = filter_mask(store, query)
+        
+        # The ROI-ordered index makes the ROI threshold a prefix cut, already sorted by ROI
+        roi_order = store["sort_orders"]["Highest ROI"]
+        roi_prefix = roi_order[:np.count_nonzero(store["roi"] >= min_roi)]
+        rows = roi_prefix[mask[roi_prefix]]
+        
+        # User-tunable weights for the investment score
+        with st.expander("Ranking Weights / أوزان الترتيب"):
+            weights = {}
+            weight_labels = {
+                "roi": "ROI / العائد",
+                "value": "Price vs Area Median / السعر مقابل متوسط المنطقة",
+                "safety": "Environmental Safety / السلامة البيئية",
+                "quality": "Neighborhood Quality / جودة الحي"
+            }
+            for col, (name, label) in zip(st.columns(len(weight_labels)), weight_labels.items()):
+                with col:
+                    weights[name] = st.slider(label, min_value=0, max_value=5, value=INVESTMENT_WEIGHTS[name], key=f"inv_weight_{name}")
         
-        # Sort by ROI
-        investment_properties.sort(key=lambda x: float(x.get('roi_estimate', '5.0%').strip('%')), reverse=True)
+        # Score every listing in one pass, then keep the best of the matching ones
+        scores = investment_scores(store, weights)
+        ranked = top_scored_rows(rows, scores[rows], INVESTMENT_TABLE_SIZE)
         
-        st.markdown(f"<h3>Found {len(investment_properties)} investment properties</h3>", unsafe_allow_html=True)
+        st.markdown(f"<h3>Found {len(rows)} investment properties</h3>", unsafe_allow_html=True)
         
         # Create a table to compare investment properties
-        if investment_properties:
-            data = []
-            for p in investment_properties:
-                data.append({
-                    "Property": p["title"],
-                    "Type": p["type"],
-                    "Area": p["area"],
-                    "Price (SAR)": f"{p['price']:,}",
-                    "Size (sqm)": p["size_sqm"],
-                    "Est. ROI": p.get("roi_estimate", "5.0%"),
-                    "Action": ""
-                })
-            
-            df = pd.DataFrame(data)
-            st.table(df[["Property", "Type", "Area", "Price (SAR)", "Size (sqm)", "Est. ROI"]])
+        if len(rows):
+            if len(rows) > len(ranked):
+                st.caption(f"Showing the top {len(ranked)} by investment score")
+            df = pd.DataFrame({
+                "Property": [store["title"][row] for row in ranked],
+                "Type": [store["type_labels"][code] for code in store["type_code"][ranked]],
+                "Area": [store["area_labels"][code] for code in store["area_code"][ranked]],
+                "Price (SAR)": [f"{price:,}" for price in store["price"][ranked]],
+                "Size (sqm)": store["size_sqm"][ranked],
+                "Est. ROI": [f"{roi:.1f}%" for roi in store["roi"][ranked]],
+                "Score": [f"{score:.0f}" for score in scores[ranked]]
+            })
+            st.table(df)
             
             # Display the top 3 investment properties
             st.subheader("Top Investment Opportunities")
             cols = st.columns(3)
-            for i, prop in enumerate(investment_properties[:3]):
+            for i, row in enumerate(ranked[:3]):
+                prop = get_listing_view(store, row)
                 with cols[i]:
                     # Add a badge for ROI
-                    display_property_card(prop)
-                    st.markdown(f"<div style='text-align: center; background-color: #e6f4ff; padding: 10px; border-radius: 5px; margin-top: -10px;'><b>Expected ROI: {prop.get('roi_estimate', '5.0%')}</b></div>", unsafe_allow_html=True)
+                    display_property_card(prop, key_prefix="inv_btn")
+                    st.markdown(f"<div style='text-align: center; background-color: #e6f4ff; padding: 10px; border-radius: 5px; margin-top: -10px;'><b>Expected ROI: {prop.get('roi_estimate', '5.0%')} · Score: {scores[row]:.0f}</b></div>", unsafe_allow_html=True)
 
 # Property details page
 def show_property_details():
     property_id = st.session_state.selected_property
-    properties = load_properties()
-    prop = next((p for p in properties if p['id'] == property_id), None)
+    store = load_listing_store()
+    prop = get_listing(store, property_id)
     
     if not prop:
         st.error("Property not found / لم يتم العثور على العقار")
@@ -1296,6 +3013,15 @@ def show_property_details():
             st.markdown(feature_ar_html, unsafe_allow_html=True)
         
         with col2:
+            # Price per sqm against listings of the same type in the same area
+            price_per_sqm = prop['price'] / max(prop['size_sqm'], 1)
+            area_stats = get_price_stats(load_listing_store(), prop['area'], prop['type'])
+            area_median = f"{area_stats['median_price_per_sqm']:,.0f} SAR" if area_stats else "N/A"
+            estimate = predict_property_price(load_valuation_model(), prop)
+            price_flag = int(store["price_flag"][store["row_by_id"][prop["id"]]])
+            fair_price = {-1: ("Below market", "green"), 0: ("In line with market", "#1e3c72"), 1: ("Above market", "#d9534f"),
+                          FAIR_PRICE_NOT_ASSESSED: ("Not enough comparable listings", "#666")}[price_flag]
+            
             # Price and stats card
             st.markdown(f"""
             <div style="background-color: white; padding: 20px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.05); text-align: center; margin-bottom: 20px;">
@@ -1324,6 +3050,22 @@ def show_property_details():
                     </div>
                 </div>
                 <div style="margin: 20px 0; text-align: left;">
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                        <span>Estimated value:</span>
+                        <span style="font-weight: bold; color: #1e3c72;">{estimate:,.0f} SAR ({(estimate - prop['price']) / prop['price']:+.0%} vs asking)</span>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                        <span>Fair price check:</span>
+                        <span style="font-weight: bold; color: {fair_price[1]};">{fair_price[0]}</span>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                        <span>Price per sqm:</span>
+                        <span style="font-weight: bold; color: #1e3c72;">{price_per_sqm:,.0f} SAR</span>
+                    </div>
+                    <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
+                        <span>{prop['type']} median in {prop['area']}:</span>
+                        <span>{area_median}</span>
+                    </div>
                     <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
                         <span>Expected ROI:</span>
                         <span style="font-weight: bold; color: #1e3c72;">{prop.get('roi_estimate', '5.0%')}</span>
@@ -1351,6 +3093,15 @@ def show_property_details():
             with col2:
                 st.button("Save Property", use_container_width=True)
                 st.button("Calculate Mortgage", use_container_width=True, on_click=lambda: setattr(st.session_state, "page", "Financing Hub"))
+        
+        # Comparable listings by size, rooms, type, location and price
+        comparable_rows, _ = find_comparables(store, store["row_by_id"][prop["id"]], k=3)
+        if len(comparable_rows):
+            st.subheader("Similar Properties / عقارات مشابهة")
+            cols = st.columns(3)
+            for col, row in zip(cols, comparable_rows):
+                with col:
+                    display_property_card(get_listing_view(store, row), key_prefix="similar_btn")
     
     with tab2:
         # Environmental risk analysis
@@ -1361,7 +3112,7 @@ def show_property_details():
             
             # Risk recommendations
             st.subheader("Risk Recommendations")
-            area_risks = next((r for r in load_risk_data() if r["name"] == prop['area']), None)
+            area_risks = get_area_risks(prop['area'])
             
             if area_risks:
                 for risk_type, value in [
@@ -1392,7 +3143,7 @@ def show_property_details():
             st.pyplot(fig)
             
             # Neighborhood metrics
-            neighborhood = next((n for n in load_neighborhoods() if n["name"] == prop['area']), None)
+            neighborhood = get_area_quality(prop['area'])
             
             if neighborhood:
                 st.subheader("Detailed Ratings")
@@ -1440,11 +3191,7 @@ def show_property_details():
                 
                 col1, col2, col3 = st.columns(3)
                 
-                amenities = {
-                    "Schools": ["International School of Riyadh", "Al Nakheel Academy", "British International School"],
-                    "Hospitals": ["King Faisal Hospital", "Saudi German Hospital", "Dr. Sulaiman Al Habib Hospital"],
-                    "Shopping": ["Kingdom Centre Mall", "Al Nakheel Mall", "Granada Mall"]
-                }
+                amenities = get_area_amenities(prop['area'])
                 
                 with col1:
                     st.markdown("""
@@ -1753,7 +3500,7 @@ def show_environmental_analysis():
     # Risk details
     st.subheader("Risk Details / تفاصيل المخاطر")
     
-    area_risks = next((r for r in load_risk_data() if r["name"] == area), None)
+    area_risks = get_area_risks(area)
     
     if area_risks:
         # Create a table with risk levels and descriptions
@@ -1800,8 +3547,11 @@ def show_environmental_analysis():
                                 }[x])
         
         # Create comparison data
-        risk_comparison = [{"Area": r["name"], "Risk": r[risk_type]} for r in load_risk_data()]
-        risk_comparison_df = pd.DataFrame(risk_comparison)
+        registry = load_area_registry()
+        risk_comparison_df = pd.DataFrame({
+            "Area": np.array(registry["names"])[registry["has_risk"]],
+            "Risk": registry["risk"][registry["has_risk"], RISK_METRICS.index(risk_type)]
+        })
         
         # Sort by risk level
         risk_comparison_df = risk_comparison_df.sort_values("Risk", ascending=False)
@@ -1879,8 +3629,8 @@ def show_neighborhood_comparison():
         area2 = st.selectbox("Area 2", area_names, index=1 if len(area_names) > 1 else 0)
     
     # Get neighborhood data
-    neighborhood1 = next((n for n in neighborhoods if n["name"] == area1), None)
-    neighborhood2 = next((n for n in neighborhoods if n["name"] == area2), None)
+    neighborhood1 = get_area_quality(area1)
+    neighborhood2 = get_area_quality(area2)
     
     if neighborhood1 and neighborhood2:
         # Create comparison data for radar chart
@@ -1979,13 +3729,40 @@ def show_neighborhood_comparison():
         comparison_df = pd.DataFrame(comparison_data)
         st.table(comparison_df)
         
+        # Listing prices in both areas, from the precomputed area statistics
+        st.subheader("Market Prices / أسعار السوق")
+        
+        store = load_listing_store()
+        stats1 = get_price_stats(store, area1)
+        stats2 = get_price_stats(store, area2)
+        
+        if stats1 and stats2:
+            st.table(pd.DataFrame({
+                "Metric": ["Listings", "Median Price/sqm (SAR)", "Average Price/sqm (SAR)", "Middle Half Price/sqm (SAR)", "Median ROI"],
+                f"{area1}": [
+                    stats1["count"],
+                    f"{stats1['median_price_per_sqm']:,.0f}",
+                    f"{stats1['mean_price_per_sqm']:,.0f}",
+                    f"{stats1['price_per_sqm_quantiles'][0.25]:,.0f} - {stats1['price_per_sqm_quantiles'][0.75]:,.0f}",
+                    f"{stats1['median_roi']:.1f}%"
+                ],
+                f"{area2}": [
+                    stats2["count"],
+                    f"{stats2['median_price_per_sqm']:,.0f}",
+                    f"{stats2['mean_price_per_sqm']:,.0f}",
+                    f"{stats2['price_per_sqm_quantiles'][0.25]:,.0f} - {stats2['price_per_sqm_quantiles'][0.75]:,.0f}",
+                    f"{stats2['median_roi']:.1f}%"
+                ]
+            }).astype(str))
+        else:
+            st.write("No listing price data available for one of these areas.")
+        
         # Environmental risks comparison
         st.subheader("Environmental Risks Comparison / مقارنة المخاطر البيئية")
         
         # Get risk data
-        risk_data = load_risk_data()
-        risk1 = next((r for r in risk_data if r["name"] == area1), None)
-        risk2 = next((r for r in risk_data if r["name"] == area2), None)
+        risk1 = get_area_risks(area1)
+        risk2 = get_area_risks(area2)
         
         if risk1 and risk2:
             # Create comparison data
@@ -2053,38 +3830,9 @@ def show_neighborhood_comparison():
         # Nearby amenities comparison
         st.subheader("Nearby Amenities Comparison / مقارنة المرافق القريبة")
         
-        # Sample amenities data (in a real app, this would come from a database)
-        amenities_data = {
-            "Al Olaya": {
-                "Schools": ["International School of Riyadh", "Al Olaya Academy", "British International School"],
-                "Hospitals": ["King Faisal Specialist Hospital", "Saudi German Hospital", "Dr. Sulaiman Al Habib Hospital"],
-                "Shopping": ["Kingdom Centre Mall", "Olaya Malls Complex", "Centria Mall"]
-            },
-            "Al Nakheel": {
-                "Schools": ["American International School", "Al Nakheel Academy", "French International School"],
-                "Hospitals": ["Al Nakheel Medical Center", "Saudi German Hospital", "Dr. Sulaiman Al Habib Hospital"],
-                "Shopping": ["Al Nakheel Mall", "Hayat Mall", "Localizer Mall"]
-            },
-            "Hittin": {
-                "Schools": ["Hittin International School", "Al Hittin Academy", "KAUST School"],
-                "Hospitals": ["Hittin Medical Center", "Healthcare Clinic", "Family Medical Center"],
-                "Shopping": ["Riyadh Front", "Al Hittin Plaza", "U-Walk"]
-            },
-            "Al Malaz": {
-                "Schools": ["Al Malaz Public School", "Eastern Academy", "Technical College"],
-                "Hospitals": ["Al Malaz Hospital", "Security Forces Hospital", "Red Crescent Center"],
-                "Shopping": ["Al Malaz Commercial Center", "Al Makan Mall", "Traditional Souq"]
-            },
-            "Al Naseem": {
-                "Schools": ["Al Naseem Academy", "Modern Education School", "Technical Institute"],
-                "Hospitals": ["Al Naseem Medical Center", "Family Clinic", "Eastern Hospital"],
-                "Shopping": ["Al Naseem Plaza", "Corner Mall", "Eastern Market"]
-            }
-        }
-        
         # Get amenities for selected areas
-        amenities1 = amenities_data.get(area1, {"Schools": [], "Hospitals": [], "Shopping": []})
-        amenities2 = amenities_data.get(area2, {"Schools": [], "Hospitals": [], "Shopping": []})
+        amenities1 = get_area_amenities(area1)
+        amenities2 = get_area_amenities(area2)
         
         # Create side-by-side comparison
         col1, col2 = st.columns(2)
@@ -2198,29 +3946,18 @@ def show_neighborhood_comparison():
             family_size = st.slider("Family Size / حجم العائلة", 1, 10, 4)
             
             if st.button("Get Recommendation", type="primary"):
-                # Calculate weighted scores
-                scores = {}
+                # Calculate weighted scores for every area with quality data at once
+                registry = load_area_registry()
+                rows = np.flatnonzero(registry["has_quality"])
+                weights = np.array([priorities[metric] for metric in QUALITY_METRICS])
                 
-                for n in neighborhoods:
-                    area_name = n["name"]
-                    
-                    # Calculate environmental score (inverse of risk - higher is better)
-                    risk = next((r for r in risk_data if r["name"] == area_name), None)
-                    if risk:
-                        env_score = 100 - (sum([risk['flood_risk'], risk['air_pollution'], risk['heat_island'], risk['water_quality']]) / 4)
-                    else:
-                        env_score = 50  # Default
-                    
-                    # Calculate weighted score
-                    score = (
-                        priorities["safety"] * n["safety"] +
-                        priorities["schools"] * n["schools"] +
-                        priorities["healthcare"] * n["healthcare"] +
-                        priorities["shopping"] * n["shopping"] +
-                        priorities["transportation"] * n["transportation"] +
-                        priorities["environmental"] * env_score
-                    ) / sum(priorities.values())
-                    
+                # Environmental score is the inverse of the mean risk (higher is better)
+                env_scores = np.where(registry["has_risk"][rows], 100 - registry["risk"][rows].mean(axis=1), 50)
+                weighted = registry["quality"][rows] @ weights + priorities["environmental"] * env_scores
+                area_scores = weighted / sum(priorities.values())
+                
+                scores = {}
+                for area_name, score in zip([registry["names"][row] for row in rows], area_scores.tolist()):
                     # Adjust for price preference
                     if price_range == "Budget" and area_name in ["Al Naseem", "Al Malaz"]:
                         score += 15
@@ -2258,7 +3995,7 @@ def show_neighborhood_comparison():
                 st.markdown("<br>", unsafe_allow_html=True)
                 st.subheader("Why We Recommended This Neighborhood")
                 
-                neighborhood_details = next((n for n in neighborhoods if n["name"] == best_neighborhood), None)
+                neighborhood_details = get_area_quality(best_neighborhood)
                 
                 if neighborhood_details:
                     # Create explanation text
@@ -2294,12 +4031,14 @@ def show_neighborhood_comparison():
                     # Show top 3 properties in that neighborhood
                     st.subheader(f"Top Properties in {best_neighborhood}")
                     
-                    properties = [p for p in load_properties() if p["area"] == best_neighborhood]
-                    if properties:
-                        cols = st.columns(min(3, len(properties)))
-                        for i, prop in enumerate(properties[:3]):
+                    store = load_listing_store()
+                    area_code = store["area_codes"].get(best_neighborhood, -1)
+                    area_rows = np.flatnonzero(store["area_code"] == area_code)[:3]
+                    if len(area_rows):
+                        cols = st.columns(len(area_rows))
+                        for i, row in enumerate(area_rows):
                             with cols[i]:
-                                display_property_card(prop)
+                                display_property_card(get_listing_view(store, row))
                     else:
                         st.info(f"No properties available in {best_neighborhood} at the moment.")
 
@@ -2370,55 +4109,76 @@ def show_financing_hub():
             </div>
             """.format(mortgage_info['total_payment']), unsafe_allow_html=True)
         
+        # Monthly payment for every rate and term combination, in one broadcast call
+        with st.expander("Payment Matrix by Rate and Term / مصفوفة الدفعات حسب المعدل والمدة", expanded=False):
+            matrix_rates = np.round(np.arange(1.0, 8.01, 0.5), 1)
+            matrix_terms = np.arange(5, 31, 5)
+            payment_matrix = calculate_mortgage(property_price, down_payment_percent, matrix_rates[:, None], matrix_terms[None, :])["monthly_payment"]
+            
+            payment_df = pd.DataFrame(payment_matrix, index=[f"{rate:.1f}%" for rate in matrix_rates], columns=[f"{term} years" for term in matrix_terms])
+            st.dataframe(payment_df.style.format("{:,.0f} SAR"), use_container_width=True)
+            st.caption(f"Monthly payments for a {property_price:,.0f} SAR property with {down_payment_percent}% down payment")
+        
         # Amortization schedule
         st.subheader("Amortization Schedule / جدول الإطفاء")
         
         with st.expander("View Full Amortization Schedule", expanded=False):
             # Create amortization schedule
-            amortization_data = []
-            remaining_balance = mortgage_info['loan_amount']
-            monthly_interest_rate = interest_rate / 100 / 12
-            monthly_payment = mortgage_info['monthly_payment']
-            
-            for year in range(1, loan_years + 1):
-                yearly_principal = 0
-                yearly_interest = 0
-                
-                for month in range(1, 13):
-                    # Calculate interest for this month
-                    month_interest = remaining_balance * monthly_interest_rate
-                    
-                    # Calculate principal for this month
-                    month_principal = monthly_payment - month_interest
-                    
-                    # Update remaining balance
-                    remaining_balance -= month_principal
-                    
-                    # Add to yearly totals
-                    yearly_principal += month_principal
-                    yearly_interest += month_interest
-                
-                # Add yearly data to amortization schedule
-                amortization_data.append({
-                    "Year": year,
-                    "Principal Paid": yearly_principal,
-                    "Interest Paid": yearly_interest,
-                    "Total Paid": yearly_principal + yearly_interest,
-                    "Remaining Balance": max(0, remaining_balance)
-                })
-            
-            # Convert to DataFrame
-            amortization_df = pd.DataFrame(amortization_data)
-            
-            # Format columns
-            amortization_df["Principal Paid"] = amortization_df["Principal Paid"].map("SAR {:,.0f}".format)
-            amortization_df["Interest Paid"] = amortization_df["Interest Paid"].map("SAR {:,.0f}".format)
-            amortization_df["Total Paid"] = amortization_df["Total Paid"].map("SAR {:,.0f}".format)
-            amortization_df["Remaining Balance"] = amortization_df["Remaining Balance"].map("SAR {:,.0f}".format)
+            schedule = amortization_schedule(mortgage_info['loan_amount'], interest_rate, loan_years)
+            
+            # Format only the yearly rows that are shown
+            amortization_df = pd.DataFrame({
+                "Year": schedule["years"].astype(int),
+                "Principal Paid": [f"SAR {value:,.0f}" for value in schedule["yearly_principal"]],
+                "Interest Paid": [f"SAR {value:,.0f}" for value in schedule["yearly_interest"]],
+                "Total Paid": [f"SAR {value:,.0f}" for value in schedule["yearly_principal"] + schedule["yearly_interest"]],
+                "Remaining Balance": [f"SAR {value:,.0f}" for value in schedule["yearly_balance"]]
+            })
             
             # Display the table
             st.table(amortization_df)
         
+        # Prepayment simulator
+        with st.expander("Prepayment Simulator / محاكي السداد المبكر", expanded=False):
+            prepay_col1, prepay_col2, prepay_col3 = st.columns(3)
+            
+            with prepay_col1:
+                lump_sum = st.number_input("Lump Sum Payment (SAR) / دفعة مقطوعة", min_value=0, max_value=int(mortgage_info['loan_amount']), value=min(100000, int(mortgage_info['loan_amount'])), step=10000, format="%d")
+            
+            with prepay_col2:
+                lump_year = st.slider("Lump Sum Paid in Year / سنة الدفعة المقطوعة", min_value=1, max_value=loan_years, value=min(5, loan_years))
+            
+            with prepay_col3:
+                extra_monthly = st.number_input("Extra Monthly Payment (SAR) / دفعة شهرية إضافية", min_value=0, max_value=50000, value=1000, step=500, format="%d")
+            
+            # Every combination of lump sum, recurring extra and mode is simulated together
+            strategy_lumps = np.array([0, lump_sum])[:, None, None]
+            strategy_extras = np.unique([0, extra_monthly // 2, extra_monthly, extra_monthly * 2])[None, :, None]
+            strategy_modes = np.array([True, False])[None, None, :]
+            prepayments = simulate_prepayments(mortgage_info['loan_amount'], interest_rate, loan_years,
+                                               strategy_lumps, lump_year * 12, strategy_extras, strategy_modes)
+            
+            grid_lumps, grid_extras, grid_modes = [grid.ravel() for grid in np.broadcast_arrays(strategy_lumps, strategy_extras, strategy_modes)]
+            strategy_rows = np.flatnonzero((grid_lumps > 0) | (grid_extras > 0))
+            strategy_rows = strategy_rows[np.argsort(-prepayments["interest_saved"].ravel()[strategy_rows], kind="stable")]
+            
+            if len(strategy_rows):
+                st.table(pd.DataFrame({
+                    "Lump Sum": [f"SAR {grid_lumps[row]:,.0f}" for row in strategy_rows],
+                    "Extra Monthly": [f"SAR {grid_extras[row]:,.0f}" for row in strategy_rows],
+                    "Mode": ["Reduce term" if grid_modes[row] else "Reduce payment" for row in strategy_rows],
+                    "Avg. Monthly Payment (excl. extra)": [f"SAR {prepayments['average_payment'].ravel()[row]:,.0f}" for row in strategy_rows],
+                    "Interest Saved": [f"SAR {prepayments['interest_saved'].ravel()[row]:,.0f}" for row in strategy_rows],
+                    "Payoff Date": [str(prepayments['payoff_date'].ravel()[row]) for row in strategy_rows],
+                    "Months Saved": [int(prepayments['months_saved'].ravel()[row]) for row in strategy_rows]
+                }))
+            else:
+                st.info("Enter a lump sum or an extra monthly payment to compare prepayment strategies.")
+            
+            settlement_banks = [bank["name"] for bank in load_banks() if "Zero early settlement fees" in bank["special_offers"]]
+            if settlement_banks:
+                st.caption(f"No early settlement fees at: {', '.join(settlement_banks)}")
+        
         # Payment visualization
         st.subheader("Payment Visualization / تصور المدفوعات")
         
@@ -2575,6 +4335,58 @@ def show_financing_hub():
                     
                     # Apply button
                     st.button(f"Apply with {bank['name']}", key=f"apply_{bank['name']}")
+        
+        # Conventional and Islamic products across every bank and term
+        st.subheader("Conventional vs Islamic Financing / التمويل التقليدي مقابل الإسلامي")
+        
+        product_col1, product_col2, product_col3 = st.columns(3)
+        
+        with product_col1:
+            product_price = st.number_input("Property Price (SAR) / سعر العقار", min_value=100000, max_value=10000000, value=1000000, step=50000, format="%d", key="product_price")
+        
+        with product_col2:
+            product_down_payment = st.slider("Down Payment (%) / الدفعة المقدمة", min_value=10, max_value=50, value=20, step=5, key="product_down_payment")
+        
+        with product_col3:
+            product_metric = st.selectbox("Compare / قارن", ["Monthly Payment", "Total Repaid", "Effective Annual Rate"], key="product_metric")
+        
+        financed_amount = product_price * (1 - product_down_payment / 100)
+        product_rates = np.array([bank["interest_rate"] for bank in banks])[:, None]
+        product_terms = np.arange(5, 31, 5)[None, :]
+        
+        # One broadcast pass per engine over the banks x terms grid
+        conventional = calculate_mortgage(financed_amount, 0, product_rates, product_terms)
+        islamic = calculate_islamic_financing(financed_amount, product_rates, product_terms)
+        quoted_rates = np.broadcast_to(product_rates, conventional["monthly_payment"].shape)
+        
+        product_values = {
+            "Monthly Payment": [("Conventional", conventional["monthly_payment"]), ("Murabaha", islamic["murabaha_installment"]), ("Ijara", islamic["ijara_rental"])],
+            "Total Repaid": [("Conventional", conventional["total_payment"]), ("Murabaha", islamic["murabaha_total_payment"]), ("Ijara", islamic["ijara_total_rent"])],
+            "Effective Annual Rate": [("Conventional", quoted_rates), ("Murabaha", islamic["murabaha_effective_rate"]), ("Ijara", quoted_rates)]
+        }[product_metric]
+        value_format = "{:.2f}%" if product_metric == "Effective Annual Rate" else "SAR {:,.0f}"
+        
+        product_rows = []
+        for bank_index, bank in enumerate(banks):
+            for product, values in product_values:
+                # Islamic products are only offered by Sharia-compliant banks
+                if product != "Conventional" and not bank["sharia_compliant"]:
+                    continue
+                row = {"Bank": bank["name"], "Product": product}
+                for term_index, term in enumerate(product_terms[0]):
+                    row[f"{term} years"] = value_format.format(values[bank_index, term_index]) if term <= bank["max_loan_term"] else "-"
+                product_rows.append(row)
+        
+        st.table(pd.DataFrame(product_rows))
+        st.caption("Murabaha uses each bank's rate as a flat profit rate on the financed amount; Ijara rent amortizes the bank's acquisition cost at the same rate. Terms beyond a bank's maximum are shown as -.")
+        
+        sharia_banks = [bank for bank in banks if bank["sharia_compliant"]]
+        if sharia_banks:
+            with st.expander("Islamic Financing Schedule / جدول التمويل الإسلامي", expanded=False):
+                schedule_bank = st.selectbox("Bank / البنك", [bank["name"] for bank in sharia_banks], key="islamic_schedule_bank")
+                schedule_bank = next(bank for bank in sharia_banks if bank["name"] == schedule_bank)
+                schedule_df = islamic_financing_schedule(financed_amount, schedule_bank["interest_rate"], schedule_bank["max_loan_term"])
+                st.table(schedule_df.set_index("Year").map("SAR {:,.0f}".format))
     
     with tabs[2]:
         st.subheader("Financing Assistant / مساعد التمويل")
@@ -2625,8 +4437,8 @@ def show_financing_hub():
         col1, col2 = st.columns(2)
         
         with col1:
-            down_payment_percent = st.slider("Down Payment (%) / الدفعة المقدمة", min_value=10, max_value=50, value=20, step=5)
-            preferred_term = st.slider("Preferred Loan Term (Years) / المدة المفضلة للقرض بالسنوات", min_value=5, max_value=30, value=25, step=5)
+            down_payment_percent = st.slider("Down Payment (%) / الدفعة المقدمة", min_value=10, max_value=50, value=20, step=5, key="assistant_down_payment")
+            preferred_term = st.slider("Preferred Loan Term (Years) / المدة المفضلة للقرض بالسنوات", min_value=5, max_value=30, value=25, step=5, key="assistant_loan_term")
         
         with col2:
             rate_preference = st.radio("Rate Preference / تفضيل المعدل", ["Fixed Rate", "Variable Rate", "Islamic Financing", "No Preference"])
@@ -2692,6 +4504,9 @@ def show_financing_hub():
                 
                 banks = load_banks()
                 
+                # Payments at every bank's rate, in one call
+                bank_mortgages = calculate_mortgage(property_price, down_payment_percent, [bank["interest_rate"] for bank in banks], preferred_term)
+                
                 # Filter and score banks based on user preferences
                 bank_scores = []
                 
@@ -2711,7 +4526,7 @@ def show_financing_hub():
                         score += 10
                     
                     # Additional scoring based on preferences
-                    if rate_preference == "Islamic Financing" and bank["name"] in ["Al Rajhi Bank", "Alinma Bank"]:
+                    if rate_preference == "Islamic Financing" and bank["sharia_compliant"]:
                         score += 20
                     
                     if employment_type == "Government Employee" and "Government employee discount" in bank["special_offers"]:
@@ -2736,8 +4551,8 @@ def show_financing_hub():
                 
                 # Display recommended banks
                 for i, (bank, score) in enumerate(bank_scores[:3]):
-                    # Calculate mortgage based on this bank
-                    mortgage = calculate_mortgage(property_price, down_payment_percent, bank["interest_rate"], preferred_term)
+                    # Mortgage figures at this bank's rate
+                    mortgage = {name: values[banks.index(bank)] for name, values in bank_mortgages.items()}
                     
                     st.markdown(f"""
                     <div style="background-color: white; padding: 20px; border-radius: 10px; margin-bottom: 20px; box-shadow: 0 2px 5px rgba(0,0,0,0.05);">
@@ -2778,7 +4593,7 @@ def show_financing_hub():
                     if mortgage['monthly_payment'] <= monthly_payment_max:
                         reasons.append(f"Monthly payment of {mortgage['monthly_payment']:,.0f} SAR is within your budget")
                     
-                    if rate_preference == "Islamic Financing" and bank["name"] in ["Al Rajhi Bank", "Alinma Bank"]:
+                    if rate_preference == "Islamic Financing" and bank["sharia_compliant"]:
                         reasons.append("Offers Islamic financing options aligned with your preferences")
                     
                     if employment_type == "Government Employee" and "Government employee discount" in bank["special_offers"]:
@@ -2821,6 +4636,73 @@ def show_financing_hub():
                     
                     st.markdown("</div>", unsafe_allow_html=True)
                 
+                # Highest price each bank would finance, and how many listings fall within it
+                st.subheader("What You Can Afford / ما يمكنك تحمله")
+                
+                afford_terms = np.arange(5, 31, 5)
+                affordability = max_affordable_price(
+                    monthly_income, monthly_payment_max, savings,
+                    np.array([bank["interest_rate"] for bank in banks])[:, None], afford_terms[None, :],
+                    np.array([max(bank["min_down_payment"], down_payment_percent) for bank in banks])[:, None],
+                    np.array([bank["processing_fee"] for bank in banks])[:, None])
+                
+                store = load_listing_store()
+                afford_query = build_search_query(property_type=[property_type],
+                                                  area=[property_location] if property_location in store["area_codes"] else None)
+                afford_mask = filter_mask(store, afford_query)
+                afford_counts = affordable_listing_counts(store, affordability["max_price"], afford_mask)
+                
+                afford_rows = []
+                for bank_index, bank in enumerate(banks):
+                    row = {"Bank": bank["name"]}
+                    for term_index, term in enumerate(afford_terms):
+                        row[f"{term} years"] = f"SAR {affordability['max_price'][bank_index, term_index]:,.0f} ({afford_counts[bank_index, term_index]} listings)" if term <= bank["max_loan_term"] else "-"
+                    afford_rows.append(row)
+                
+                st.table(pd.DataFrame(afford_rows))
+                st.caption(f"Payments capped at SAR {min(monthly_payment_max, monthly_income * AFFORDABILITY_MAX_DTI / 100):,.0f} ({AFFORDABILITY_MAX_DTI}% of income at most); savings cover the down payment (at least {down_payment_percent}% or the bank's minimum) and the processing fee. Listing counts are for {property_type.lower()} properties{' in ' + property_location if property_location in store['area_codes'] else ''}.")
+                
+                # Listings within the top pick's budget at the preferred term
+                if bank_scores and preferred_term <= bank_scores[0][0]["max_loan_term"]:
+                    top_bank = bank_scores[0][0]
+                    top_bank_index = banks.index(top_bank)
+                    term_index = int(np.searchsorted(afford_terms, preferred_term))
+                    if term_index < len(afford_terms) and afford_terms[term_index] == preferred_term:
+                        budget = affordability["max_price"][top_bank_index, term_index]
+                        budget_rows = affordable_listings(store, budget, 3, afford_mask)
+                        if len(budget_rows):
+                            st.markdown(f"<h4>Properties you can afford with {top_bank['name']} over {preferred_term} years</h4>", unsafe_allow_html=True)
+                            cols = st.columns(len(budget_rows))
+                            for i, row in enumerate(budget_rows):
+                                with cols[i]:
+                                    display_property_card(get_listing_view(store, row))
+                
+                # Variable-rate risk for the top pick
+                if rate_preference == "Variable Rate" and bank_scores:
+                    top_bank = bank_scores[0][0]
+                    st.subheader("Variable Rate Risk / مخاطر المعدل المتغير")
+                    
+                    variable_rate = simulate_variable_rate_mortgage(property_price * (1 - down_payment_percent / 100), top_bank["interest_rate"], preferred_term)
+                    bands = variable_rate["payment_bands"]
+                    bands_df = pd.DataFrame({
+                        "Year": variable_rate["years"],
+                        "p5": bands[0], "p25": bands[1], "Median": bands[2], "p75": bands[3], "p95": bands[4]
+                    })
+                    
+                    outer_band = alt.Chart(bands_df).mark_area(opacity=0.2, color="#9a86fe").encode(
+                        x="Year:Q", y=alt.Y("p5:Q", title="Monthly Payment (SAR)"), y2="p95:Q")
+                    inner_band = alt.Chart(bands_df).mark_area(opacity=0.4, color="#9a86fe").encode(x="Year:Q", y="p25:Q", y2="p75:Q")
+                    median_line = alt.Chart(bands_df).mark_line(color="#1e3c72").encode(x="Year:Q", y="Median:Q")
+                    st.altair_chart(outer_band + inner_band + median_line, use_container_width=True)
+                    
+                    total_costs = variable_rate["total_cost_bands"]
+                    st.table(pd.DataFrame({
+                        "Scenario": ["Best case (5th percentile)", "Median", "Worst case (95th percentile)", "Fixed at today's rate"],
+                        "Highest Monthly Payment": [f"SAR {value:,.0f}" for value in [*variable_rate["max_payment_bands"][[0, 2, 4]], variable_rate["fixed_payment"]]],
+                        "Total Repaid": [f"SAR {value:,.0f}" for value in [*total_costs[[0, 2, 4]], variable_rate["fixed_total_cost"]]]
+                    }))
+                    st.caption(f"{variable_rate['num_paths']:,} simulated rate paths starting at {top_bank['name']}'s {top_bank['interest_rate']}% and resetting yearly. Shaded bands show the 5th-95th and 25th-75th percentiles of the monthly payment.")
+                
                 # Next steps
                 st.subheader("Next Steps / الخطوات التالية")
                 
@@ -3015,14 +4897,19 @@ def show_building_inspection():
                 inspection_time = st.selectbox("Preferred Time / الوقت المفضل", ["Morning (8 AM - 12 PM)", "Afternoon (12 PM - 4 PM)", "Evening (4 PM - 8 PM)"])
             
             with col2:
-                inspector_preference = st.selectbox("Inspector Preference / تفضيل المفتش", ["No Preference"] + [i["name"] for i in inspectors])
+                inspector_index = load_inspector_index()
+                inspector_preference = st.selectbox("Inspector Preference / تفضيل المفتش", ["No Preference"] + list(inspector_index),
+                                                    format_func=lambda i: inspector_index[i]["name"] if i in inspector_index else i)
                 inspection_type_form = st.selectbox("Inspection Type / نوع الفحص", ["Pre-purchase", "Structural", "Electrical", "Comprehensive", "Maintenance"])
                 special_instructions = st.text_area("Special Instructions / تعليمات خاصة", height=100)
             
             submit_button = st.form_submit_button("Schedule Inspection / جدولة الفحص")
             
             if submit_button:
-                st.success("Your inspection has been scheduled! We'll contact you shortly to confirm the details.")
+                if inspector_preference in inspector_index:
+                    st.success(f"Your inspection with {inspector_index[inspector_preference]['name']} has been scheduled! We'll contact you shortly to confirm the details.")
+                else:
+                    st.success("Your inspection has been scheduled! We'll contact you shortly to confirm the details.")
     
     with tabs[1]:
         st.subheader("Inspection Types / أنواع الفحص")
@@ -3666,12 +5553,18 @@ def show_consultants_page():
             with col2:
                 property_interest = st.selectbox("Property Interest / اهتمام العقار", ["Buying", "Selling", "Investing", "Renting"])
                 preferred_specialty = st.selectbox("Preferred Consultant Specialty / تخصص المستشار المفضل", ["Luxury Properties", "Family Homes", "Investment Properties", "First-time Buyers", "No Preference"])
+                consultant_index = load_consultant_index()
+                consultant_preference = st.selectbox("Preferred Consultant / المستشار المفضل", ["No Preference"] + list(consultant_index),
+                                                     format_func=lambda c: consultant_index[c]["name"] if c in consultant_index else c)
                 notes = st.text_area("Additional Notes / ملاحظات إضافية", height=100)
             
             submit_button = st.form_submit_button("Submit Request / إرسال الطلب")
             
             if submit_button:
-                st.success("Your consultant request has been submitted! One of our consultants will contact you within 24 hours.")
+                if consultant_preference in consultant_index:
+                    st.success(f"Your consultant request has been submitted! {consultant_index[consultant_preference]['name']} will contact you within 24 hours.")
+                else:
+                    st.success("Your consultant request has been submitted! One of our consultants will contact you within 24 hours.")
     
     with tabs[1]:
         st.subheader("Services / الخدمات")
@@ -4424,12 +6317,12 @@ def show_buying_journey():
         # Featured properties for this stage
         st.subheader("Recommended Properties Based on Your Preferences")
         
-        properties = load_properties()[:3]  # Just use the first 3 for demo
+        store = load_listing_store()
         
         cols = st.columns(3)
-        for i, prop in enumerate(properties):
+        for i in range(min(3, store["size"])):  # Just use the first 3 for demo
             with cols[i]:
-                display_property_card(prop)
+                display_property_card(get_listing_view(store, i))
     
     elif current_stage == 2:  # Financing
         st.markdown("""
@@ -4760,4 +6653,7 @@ def show_buying_journey():
 
 # Main execution
 if __name__ == "__main__":
-    main()
+    if "--fit-valuation-model" in sys.argv:
+        fit_and_save_valuation_model()
+    else:
+        main()